@@ -0,0 +1,179 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Offline benchmark suite for the hot paths of passwordgen
+#
+#   python benchmarks/bench.py -o results.json
+#   python benchmarks/bench.py -c results.json -t 0.2
+#
+# Every benchmark reports the best per-call time over several repeats. With `-c`, results
+# are compared against an earlier run and the exit status is 1 if any benchmark got slower
+# by more than the threshold.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.pattern import Pattern
+from src.rand import FastRandom, SecureRandom
+from src.worddict import WordDictionary
+
+WORDS_FILE = os.path.join(ROOT, 'src', 'words', 'words.txt')
+PATTERNS = ['%d[4]%s=[2]%W[6-10]', '%c+^[16]', '%{dsw~}[8-12]%W^', '%W%d%W%d%W%s[2]']
+SIGNIFIERS = ['d', 's', 'w', 'c', 'W', 'ds', 'wd', 'dswc']
+FLAGS = ['', '~', '=', '+', '^']
+
+
+def timeit(func, repeat=5, target=0.05):
+	# Best seconds per call, calibrating the number of calls to roughly `target` seconds
+	number = 1
+	while True:
+		start = time.perf_counter()
+		for _ in range(number):
+			func()
+		elapsed = time.perf_counter()-start
+		if elapsed >= target/10 or number >= 1<<20:
+			break
+		number *= 10
+	number = max(1, int(number*target/max(elapsed, 1e-9)))
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		for _ in range(number):
+			func()
+		elapsed = (time.perf_counter()-start)/number
+		best = elapsed if best is None else min(best, elapsed)
+	return best, number
+
+def expressions():
+	# Every signifier set with every combination of flags, with and without word length bounds
+	for sigs in SIGNIFIERS:
+		for n in range(len(FLAGS)):
+			for flags in itertools.combinations(FLAGS[1:], n):
+				flags = ''.join(flags)
+				if len(sigs) > 1 and 'W' in sigs and '~' not in flags:
+					continue
+				sig = sigs if len(sigs) == 1 else '{'+sigs+flags+'}'
+				lengths = ['', '[6-10]'] if 'W' in sigs else ['[8]']
+				for length in lengths:
+					if len(sigs) == 1:
+						yield '%'+sig+flags+length
+					else:
+						yield '%'+sig+length
+
+def benchmarks(tmpdir, quick=False):
+	# Yield `(name, func, repeat)`
+	repeat = 3 if quick else 5
+	worddict = WordDictionary(WORDS_FILE)
+	# Dictionary parsing, loading and installing
+	raw_file = os.path.join(tmpdir, 'raw.txt')
+	with open(raw_file, 'w') as f:
+		rng = FastRandom(0)
+		for _ in range(20000):
+			f.write(' '.join(worddict.sample_word(rng=rng) for _ in range(10)) + '\n')
+	words_file = os.path.join(tmpdir, 'words.txt')
+	shutil.copyfile(WORDS_FILE, words_file)
+	yield 'worddict.parse.formatted', lambda: WordDictionary.parse(WORDS_FILE, formatted=True), 1
+	yield 'worddict.parse.raw', lambda: WordDictionary.parse(raw_file), repeat
+	yield 'worddict.load', lambda: WordDictionary(WORDS_FILE), repeat
+	yield 'worddict.setWordsFile.raw', lambda: WordDictionary.setWordsFile(words_file, raw_file, backup=False), repeat
+	yield 'worddict.setWordsFile.formatted', lambda: WordDictionary.setWordsFile(words_file, WORDS_FILE, backup=False, formatted=True), 1
+	yield 'worddict.sample_word', lambda: worddict.sample_word(), repeat
+	yield 'worddict.sample_word[6-10]', lambda: worddict.sample_word(6, 10), repeat
+	# Pattern compilation and generation
+	for pattern in PATTERNS:
+		yield 'pattern.init %s' % pattern, lambda pattern=pattern: Pattern(pattern, worddict), repeat
+		compiled = Pattern(pattern, worddict)
+		yield 'pattern.generate %s' % pattern, compiled.generate, repeat
+		if not quick:
+			yield 'pattern.generate_many(10000) %s' % pattern, lambda compiled=compiled: list(compiled.generate_many(10000, vectorize=False)), repeat
+	# Every expression, with the default and the fast randomness sources
+	for expression in expressions():
+		e = Pattern(expression, worddict).expressions[0]
+		secure, fast = SecureRandom(), FastRandom(0)
+		yield 'expression.generate %s' % expression, lambda e=e: e.generate(secure), repeat
+		if not quick:
+			yield 'expression.generate.fast %s' % expression, lambda e=e: e.generate(fast), repeat
+	# End-to-end CLI startup, with and without the word dictionary
+	for pattern in ['%d[6]', '%d[4]%s=[2]%W[6-10]']:
+		command = [sys.executable, '-m', 'src', pattern]
+		yield 'cli %s' % pattern, lambda command=command: subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, check=True), repeat
+
+def run(quick=False, select=None, out=sys.stderr):
+	results = {}
+	tmpdir = tempfile.mkdtemp()
+	try:
+		for name, func, repeat in benchmarks(tmpdir, quick):
+			if select and select not in name:
+				continue
+			seconds, number = timeit(func, repeat, 0.02 if quick else 0.05)
+			results[name] = {'seconds': seconds, 'number': number}
+			print('%-56s %12.3f us' % (name, 1e6*seconds), file=out)
+	finally:
+		shutil.rmtree(tmpdir)
+	return results
+
+def compare(results, baseline, threshold):
+	# Names of benchmarks that are slower than `baseline` by more than `threshold`
+	regressions = []
+	for name, result in sorted(results.items()):
+		if name not in baseline:
+			continue
+		ratio = result['seconds']/baseline[name]['seconds']
+		flag = ''
+		if ratio > 1+threshold:
+			regressions.append(name)
+			flag = '  REGRESSION'
+		print('%-56s %7.2fx%s' % (name, ratio, flag), file=sys.stderr)
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmarks for passwordgen')
+	parser.add_argument('-o', '--output', help='Writes results as JSON to this file')
+	parser.add_argument('-c', '--compare', help='Compares results against a JSON file written with `-o`')
+	parser.add_argument('-t', '--threshold', type=float, default=0.25, help='Allowed slowdown when comparing (defaults to 0.25, i.e. 25%%)')
+	parser.add_argument('-k', '--select', help='Only runs benchmarks whose name contains this string')
+	parser.add_argument('-q', '--quick', action='store_true', help='Fewer repeats and benchmarks, for a quick check')
+	args = parser.parse_args()
+
+	results = run(args.quick, args.select)
+	report = {
+		'meta': {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+				'platform': platform.platform(), 'time': time.time()},
+		'results': results,
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1, sort_keys=True)
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)['results']
+		regressions = compare(results, baseline, args.threshold)
+		if regressions:
+			print('%d benchmark(s) regressed by more than %d%%' % (len(regressions), 100*args.threshold), file=sys.stderr)
+			return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
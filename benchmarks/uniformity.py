@@ -0,0 +1,496 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Offline statistical uniformity and throughput harness for passwordgen
+#
+#   python benchmarks/uniformity.py -j 4 -o uniformity.json
+#   python benchmarks/uniformity.py -j 4 -c uniformity.json -k '%w^'
+#
+# Every case is one expression (every signifier set with every combination of flags and a few
+# length specifiers, and the `W` signifier with uniform and frequency-weighted dictionaries).
+# Each case is sampled with the scalar and the vectorized (NumPy) generators, and each sample is
+# checked against the distribution the pattern documentation defines, worked out here from the
+# signifiers and flags alone (never from `Expression.plans`, so a bug in compiling them shows):
+#
+# - chi-squared tests of the output lengths, of the character at every position, of adjacent
+#   character pairs, and of words and their capitalization (the position `^` capitalizes, and
+#   the per-letter coin of `+^`)
+# - exact checks that must hold for every output: `=` repeats one character, `^` capitalizes
+#   exactly one letter, `+` leaves none lowercase, words come from the dictionary range
+#
+# Throughput is reported next to the results, and `-c` compares it against an earlier `-o` run.
+# The exit status is 1 if any test fails (p-value below `--alpha`) or, with `-c`, if generation
+# got slower by more than the threshold. Expressions mixing `W` with other signifiers (`~`) are
+# not covered, as their words and characters cannot always be told apart.
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import batch
+from src.pattern import Pattern
+from src.rand import FastRandom
+from src.worddict import WordDictionary
+
+from bench import compare
+
+WORDS_FILE = os.path.join(ROOT, 'src', 'words', 'words.txt')
+SIGNIFIERS = ['d', 's', 'w', 'c', 'ds', 'wd', 'dswc']
+FLAGS = ['~', '=', '+', '^']
+LENGTHS = ['', '[8]', '[0-6]']
+WORD_LENGTHS = ['', '[6-10]']
+# Weighted dictionaries, as `(name, exponent, top)`, built from a synthetic corpus
+WEIGHTINGS = [('weighted', 1.0, None), ('weighted=0.5,top=2000', 0.5, 2000)]
+# Smallest expected count of a chi-squared bin, smaller bins are pooled together
+MIN_EXPECTED = 5
+# Most bins used for the word frequency test
+WORD_BINS = 1000
+# Failed tests printed per case
+MAX_DETAILS = 4
+
+
+# Statistics
+# ----------
+
+def gammaincc(a, x):
+	# Regularized upper incomplete gamma function Q(a, x), by its series below `a+1` and by
+	# its continued fraction (modified Lentz) above
+	if x <= 0:
+		return 1.0
+	scale = math.exp(-x + a*math.log(x) - math.lgamma(a))
+	if x < a+1:
+		term = total = 1.0/a
+		n = a
+		while abs(term) > abs(total)*1e-15:
+			n += 1
+			term *= x/n
+			total += term
+		return max(0.0, 1.0 - scale*total)
+	tiny = 1e-300
+	b = x+1-a
+	c, d = 1/tiny, 1/b
+	h = d
+	for i in range(1, 10000):
+		an = -i*(i-a)
+		b += 2
+		d = an*d + b
+		d = 1/(d if abs(d) > tiny else tiny)
+		c = b + an/c
+		c = c if abs(c) > tiny else tiny
+		h *= d*c
+		if abs(d*c-1) < 1e-15:
+			break
+	return scale*h
+
+def chi2_sf(x, dof):
+	# Probability of a chi-squared statistic of at least `x` with `dof` degrees of freedom
+	return gammaincc(dof/2, x/2) if dof > 0 else 1.0
+
+def chisquare(observed, expected):
+	"""Chi-squared goodness of fit of `observed` counts against `expected` counts.
+
+	Both map bins to counts, and `expected` must hold every possible bin with the same total
+	as `observed`. Bins expected fewer than `MIN_EXPECTED` times are pooled together. Returns
+	`(statistic, dof, p)`, where p is 0 if any impossible bin was observed.
+	"""
+	if any(count and not expected.get(key) for key, count in observed.items()):
+		return math.inf, 0, 0.0
+	bins, pooled_obs, pooled_exp = [], 0, 0.0
+	for key, exp in expected.items():
+		if exp < MIN_EXPECTED:
+			pooled_obs += observed.get(key, 0)
+			pooled_exp += exp
+		else:
+			bins.append((observed.get(key, 0), exp))
+	if pooled_exp >= MIN_EXPECTED or (pooled_exp and not bins):
+		bins.append((pooled_obs, pooled_exp))
+	elif pooled_exp and bins:
+		# Too little left over for its own bin, added to the smallest one
+		i = min(range(len(bins)), key=lambda i: bins[i][1])
+		bins[i] = (bins[i][0]+pooled_obs, bins[i][1]+pooled_exp)
+	statistic = sum((obs-exp)**2/exp for obs, exp in bins)
+	dof = len(bins)-1
+	return statistic, dof, chi2_sf(statistic, dof)
+
+def scaled(probabilities, total):
+	return {key: p*total for key, p in probabilities.items() if p > 0}
+
+
+# Expected distributions, from the documented meaning of signifiers and flags
+# ---------------------------------------------------------------------------
+
+class CharModel:
+	"""Distribution of a character expression's output, as defined by its signifiers and flags.
+
+	With `~` one signifier is picked uniformly, and the length is uniform over its range. The
+	characters are drawn uniformly from the union of the signifiers' pools, then `+` makes
+	letters uppercase, `+^` makes each letter uppercase with probability 1/2, and `^`
+	capitalizes one letter, at a uniformly random letter position. With `=` one character is
+	repeated, `^` means `+`, and `+^` flips the case of the whole sequence with probability 1/2.
+	"""
+	def __init__(self, expression):
+		flags = expression.flags
+		sigs = sorted(expression.signifiers)
+		self.choices = [[sig] for sig in sigs] if '~' in flags else [sigs]
+		self.lengths = range(expression.length_lower, expression.length_upper+1)
+		self.repeat = '=' in flags
+		if self.repeat:
+			self.caps = 'both' if {'+', '^'} <= flags else 'upper' if flags & {'+', '^'} else None
+		else:
+			self.caps = 'both' if {'+', '^'} <= flags else 'upper' if '+' in flags else 'one' if '^' in flags else None
+
+	def char_probabilities(self, sigs, length):
+		# Distribution of any one character of an output of `length` drawn from `sigs`
+		pool = sorted({c for sig in sigs for c in Pattern.pools_dict[sig]})
+		p = 1/len(pool)
+		letters = [c for c in pool if c in Pattern.lowercase]
+		# `^`: chance a letter is the one capitalized, the mean of 1/(letters in the output)
+		q = len(letters)/len(pool)
+		capitalized = (1-(1-q)**length)/(length*q) if q and length else 0
+		out = defaultdict(float)
+		for c in pool:
+			if c not in Pattern.lowercase or self.caps is None:
+				out[c] += p
+			elif self.caps == 'upper':
+				out[c.upper()] += p
+			elif self.caps == 'both':
+				out[c] += p/2
+				out[c.upper()] += p/2
+			else:
+				out[c.upper()] += p*capitalized
+				out[c] += p*(1-capitalized)
+		return out
+
+	def length_probabilities(self):
+		return {length: 1/len(self.lengths) for length in self.lengths}
+
+	def position_probabilities(self, position):
+		# Distribution of the character at `position`, among outputs long enough to have one
+		out = defaultdict(float)
+		lengths = [length for length in self.lengths if length > position]
+		for sigs in self.choices:
+			for length in lengths:
+				for c, p in self.char_probabilities(sigs, length).items():
+					out[c] += p/len(self.choices)/len(lengths)
+		return out
+
+	def pair_probabilities(self):
+		# Distribution of the first two characters, which are independent given the signifier
+		# (only without `=` and `^`, where they are not)
+		out = defaultdict(float)
+		lengths = [length for length in self.lengths if length > 1]
+		for sigs in self.choices:
+			for length in lengths:
+				chars = self.char_probabilities(sigs, length)
+				for (a, pa), (b, pb) in itertools.product(chars.items(), repeat=2):
+					out[a+b] += pa*pb/len(self.choices)/len(lengths)
+		return out
+
+	def check(self, out):
+		# Rule every output must follow, or None
+		if self.repeat and out != out[:1]*len(out):
+			return '`=` output is not one repeated character'
+		if self.caps == 'one' and sum(c.isupper() for c in out) != any(c.isalpha() for c in out):
+			return '`^` output does not have exactly one uppercase letter'
+		if self.caps == 'upper' and any(c.islower() for c in out):
+			return '`+` output has lowercase letters'
+		return None
+
+
+class WordModel:
+	"""Distribution of a `W` expression's output: a word of the dictionary's range for the
+	length specifier (uniform, or weighted by `WordDictionary.weighted`), then `+` makes it
+	uppercase, `^` capitalizes one of its letters at random, and `+^` makes each letter
+	uppercase with probability 1/2. `=` and `~` have no effect on a lone `W`. Dictionary words
+	are assumed to be lowercase, as in `Expression.char_classes`.
+	"""
+	def __init__(self, expression):
+		flags = expression.flags
+		self.caps = 'both' if {'+', '^'} <= flags else 'upper' if '+' in flags else 'one' if '^' in flags else None
+		worddict = expression.worddict
+		if expression.word_any_length:
+			start, stop = worddict.wordRange()
+		else:
+			start, stop = worddict.wordRange(expression.length_lower, expression.length_upper)
+		if worddict.weights is not None:
+			total = math.fsum(worddict.weights[start:stop])
+			probabilities = [w/total for w in worddict.weights[start:stop]]
+		else:
+			probabilities = [1/(stop-start)]*(stop-start)
+		# Words are told apart ignoring case, since capitalization changes them
+		self.words = {}
+		for i, p in enumerate(probabilities):
+			key = worddict.index.word(start+i).lower()
+			self.words[key] = self.words.get(key, 0) + p
+		self.keys = sorted(self.words)
+
+	def bins(self, n):
+		# Word -> bin, grouping consecutive words into bins of roughly equal probability
+		count = max(1, min(WORD_BINS, n//(4*MIN_EXPECTED), len(self.keys)))
+		bins, probabilities = {}, defaultdict(float)
+		acc = 0.0
+		for key in self.keys:
+			b = min(count-1, int(acc*count))
+			bins[key] = b
+			probabilities[b] += self.words[key]
+			acc += self.words[key]
+		return bins, probabilities
+
+	def check(self, out):
+		word = out.lower()
+		if word not in self.words:
+			return 'word is not in the dictionary range'
+		if self.caps is None and out != word:
+			return 'word without `+` or `^` is capitalized'
+		if self.caps == 'upper' and out != out.upper():
+			return '`+` word has lowercase letters'
+		if self.caps == 'one' and sum(c.isupper() for c in out) != any(c.isalpha() for c in word):
+			return '`^` word does not have exactly one uppercase letter'
+		return None
+
+
+# Tests
+# -----
+
+def char_tests(model, outputs):
+	# Yield `(name, p, detail)` for every test of a character expression
+	n = len(outputs)
+	by_length = defaultdict(list)
+	for out in outputs:
+		by_length[len(out)].append(out)
+	observed = {length: len(outs) for length, outs in by_length.items()}
+	statistic, dof, p = chisquare(observed, scaled(model.length_probabilities(), n))
+	yield 'lengths', p, 'chi2=%.1f dof=%d' % (statistic, dof)
+	positions = position_counts(by_length, max(model.lengths))
+	for position, counts in enumerate(positions):
+		total = sum(counts.values())
+		if total:
+			statistic, dof, p = chisquare(counts, scaled(model.position_probabilities(position), total))
+			yield 'position %d' % position, p, 'chi2=%.1f dof=%d' % (statistic, dof)
+	if not model.repeat and model.caps != 'one' and max(model.lengths) > 1:
+		pairs = Counter(out[:2] for out in outputs if len(out) > 1)
+		total = sum(pairs.values())
+		statistic, dof, p = chisquare(pairs, scaled(model.pair_probabilities(), total))
+		yield 'pairs 0-1', p, 'chi2=%.1f dof=%d' % (statistic, dof)
+	yield check_test(model, outputs)
+
+def word_tests(model, outputs):
+	# Yield `(name, p, detail)` for every test of a `W` expression
+	n = len(outputs)
+	bins, probabilities = model.bins(n)
+	observed = Counter(bins.get(out.lower(), -1) for out in outputs)
+	statistic, dof, p = chisquare(observed, scaled(probabilities, n))
+	yield 'words (%d bins)' % len(probabilities), p, 'chi2=%.1f dof=%d' % (statistic, dof)
+	if model.caps == 'one':
+		# Rank of the capitalized letter among the word's letters, by the number of letters
+		observed, expected = Counter(), defaultdict(float)
+		by_letters = Counter()
+		for out in outputs:
+			letters = [i for i, c in enumerate(out) if c.isalpha()]
+			upper = [rank for rank, i in enumerate(letters) if out[i].isupper()]
+			if len(upper) == 1:
+				observed[(len(letters), upper[0])] += 1
+				by_letters[len(letters)] += 1
+		for letters, count in by_letters.items():
+			for rank in range(letters):
+				expected[(letters, rank)] = count/letters
+		statistic, dof, p = chisquare(observed, expected)
+		yield 'capitalized letter', p, 'chi2=%.1f dof=%d' % (statistic, dof)
+	elif model.caps == 'both':
+		# Every letter is uppercase half of the time, at every position
+		observed, expected = Counter(), defaultdict(float)
+		for out in outputs:
+			for i, c in enumerate(out):
+				if c.isalpha():
+					observed[(i, c.isupper())] += 1
+					expected[(i, True)] += 0.5
+					expected[(i, False)] += 0.5
+		statistic, dof, p = chisquare(observed, expected)
+		yield 'letter case', p, 'chi2=%.1f dof=%d' % (statistic, dof)
+	yield check_test(model, outputs)
+
+def check_test(model, outputs):
+	failures = Counter(filter(None, map(model.check, outputs)))
+	if failures:
+		reason, count = failures.most_common(1)[0]
+		return 'rules', 0.0, '%d outputs: %s (e.g. %r)' % (count, reason, next(out for out in outputs if model.check(out) == reason))
+	return 'rules', 1.0, 'all outputs'
+
+def position_counts(by_length, upper):
+	# Character counts at every position, with NumPy when available
+	positions = [Counter() for _ in range(upper)]
+	for length, outs in by_length.items():
+		if not length:
+			continue
+		if batch.available():
+			numpy = batch.numpy
+			chars = numpy.frombuffer(''.join(outs).encode('latin-1'), dtype=numpy.uint8).reshape(len(outs), length)
+			for position in range(length):
+				counts = numpy.bincount(chars[:, position], minlength=256)
+				for code in numpy.flatnonzero(counts).tolist():
+					positions[position][chr(code)] += int(counts[code])
+		else:
+			for position, column in enumerate(zip(*outs)):
+				positions[position].update(column)
+	return positions
+
+
+# Cases
+# -----
+
+def cases(quick=False):
+	# Yield `(expression, dictionary)`, where dictionary is None, 'uniform' or a weighting name
+	lengths = ['[8]'] if quick else LENGTHS
+	for sigs in SIGNIFIERS:
+		for n in range(len(FLAGS)+1):
+			for flags in itertools.combinations(FLAGS, n):
+				flags = ''.join(flags)
+				sig = sigs+flags if len(sigs) == 1 else '{'+sigs+flags+'}'
+				for length in lengths:
+					yield '%'+sig+length, None
+	word_lengths = ['[6-10]'] if quick else WORD_LENGTHS
+	for n in range(4):
+		for flags in itertools.combinations(['=', '+', '^'], n):
+			for length in word_lengths:
+				yield '%W'+''.join(flags)+length, 'uniform'
+	for name, _, _ in WEIGHTINGS:
+		for flags in ['', '^']:
+			yield '%W'+flags+'[4-8]', name
+
+def corpus(tmpdir):
+	# Words file with Zipf-distributed counts, for the weighted dictionaries
+	worddict = WordDictionary(WORDS_FILE)
+	rng = FastRandom(0)
+	text_file = os.path.join(tmpdir, 'corpus.txt')
+	with open(text_file, 'w') as f:
+		for rank in range(1, 5001):
+			f.write((worddict.sample_word(4, 8, rng)+' ')*(1+20000//rank) + '\n')
+	words_file = os.path.join(tmpdir, 'words.txt')
+	WordDictionary.setWordsFile(words_file, text_file, backup=False, jobs=1)
+	return words_file
+
+dictionaries = {}
+
+def dictionary(name, words_file):
+	if name not in dictionaries:
+		if name == 'uniform':
+			dictionaries[name] = WordDictionary(WORDS_FILE)
+		else:
+			_, exponent, top = next(w for w in WEIGHTINGS if w[0] == name)
+			dictionaries[name] = WordDictionary(words_file).weighted(exponent, top)
+	return dictionaries[name]
+
+def run_case(task):
+	# Sample one case with every generator, returning `(name, result)` pairs
+	(expression, dict_name), n, seed, paths, words_file = task
+	worddict = dictionary(dict_name, words_file) if dict_name else None
+	results = []
+	for path in paths:
+		name = '%s %s%s' % (path, expression, ' '+dict_name if dict_name else '')
+		rng = FastRandom('%s:%s' % (seed, name)) if seed is not None else None
+		pattern = Pattern(expression, worddict, rng)
+		model = (WordModel if dict_name else CharModel)(pattern.expressions[0])
+		start = time.perf_counter()
+		outputs = list(pattern.generate_many(n, vectorize=path == 'batch'))
+		seconds = time.perf_counter()-start
+		tests = list((word_tests if dict_name else char_tests)(model, outputs))
+		results.append((name, {'seconds': seconds/n, 'samples': n, 'tests': tests}))
+	return results
+
+
+def run(n, quick=False, select=None, jobs=1, seed=None, alpha=1e-6, out=sys.stderr):
+	paths = ['scalar'] + (['batch'] if batch.available() else [])
+	results = {}
+	failures = 0
+	tmpdir = tempfile.mkdtemp()
+	try:
+		selected = [case for case in cases(quick) if not select or select in case[0] or (case[1] and select in case[1])]
+		words_file = corpus(tmpdir) if any(case[1] not in (None, 'uniform') for case in selected) else None
+		tasks = [(case, n, seed, paths, words_file) for case in selected]
+		if jobs > 1:
+			import multiprocessing
+			pool = multiprocessing.Pool(jobs)
+			done = pool.imap(run_case, tasks)
+		else:
+			pool = None
+			done = map(run_case, tasks)
+		try:
+			for case_results in done:
+				for name, result in case_results:
+					failed = [test for test in result['tests'] if test[1] < alpha]
+					failures += len(failed)
+					result['passed'] = not failed
+					result['p'] = min(test[1] for test in result['tests'])
+					results[name] = result
+					print('%-40s %12.0f/s  %-4s  min p=%.2e' % (name, 1/result['seconds'], 'ok' if not failed else 'FAIL', result['p']), file=out)
+					for test, p, detail in failed[:MAX_DETAILS]:
+						print('    %s: p=%.2e, %s' % (test, p, detail), file=out)
+					if len(failed) > MAX_DETAILS:
+						print('    ... and %d more' % (len(failed)-MAX_DETAILS), file=out)
+		finally:
+			if pool is not None:
+				pool.terminate()
+	finally:
+		shutil.rmtree(tmpdir)
+	samples = sum(result['samples'] for result in results.values())
+	tests = sum(len(result['tests']) for result in results.values())
+	print('%d runs (cases x generators), %d samples, %d tests, %d failed (alpha=%g)' % (len(results), samples, tests, failures, alpha), file=out)
+	return results, failures
+
+def main():
+	parser = argparse.ArgumentParser(description='Statistical uniformity and throughput harness for passwordgen')
+	parser.add_argument('-n', '--samples', type=int, default=100000, help='Samples per case and generator (defaults to %(default)s)')
+	parser.add_argument('-a', '--alpha', type=float, default=1e-6,
+						help='p-value below which a test fails (defaults to %(default)g, low enough for hundreds of cases to pass by chance)')
+	parser.add_argument('-j', '--jobs', type=int, default=1, help='Cases run at the same time in separate processes (defaults to 1)')
+	parser.add_argument('-s', '--seed', help='Samples from a seeded `FastRandom` instead of the default source, for reproducible runs')
+	parser.add_argument('-o', '--output', help='Writes results as JSON to this file')
+	parser.add_argument('-c', '--compare', help='Compares throughput against a JSON file written with `-o`')
+	parser.add_argument('-t', '--threshold', type=float, default=0.25, help='Allowed slowdown when comparing (defaults to 0.25, i.e. 25%%)')
+	parser.add_argument('-k', '--select', help='Only runs cases whose expression or dictionary contains this string')
+	parser.add_argument('-q', '--quick', action='store_true', help='Fewer length specifiers, for a quick check')
+	args = parser.parse_args()
+
+	results, failures = run(args.samples, args.quick, args.select, args.jobs, args.seed, args.alpha)
+	report = {
+		'meta': {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+				'platform': platform.platform(), 'time': time.time(), 'samples': args.samples, 'alpha': args.alpha},
+		'results': results,
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1, sort_keys=True)
+	status = 1 if failures else 0
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)['results']
+		regressions = compare(results, baseline, args.threshold)
+		if regressions:
+			print('%d case(s) generated slower by more than %d%%' % (len(regressions), 100*args.threshold), file=sys.stderr)
+			status = 1
+	return status
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -25,7 +25,9 @@ PACKAGES			= [	'passwordgen'	]
 PACKAGE_DIR 		= {	'passwordgen': 'src'	}
 PACKAGE_DATA 		= {	'passwordgen': ['words/words.txt', 'words/defaults/*.txt']	}
 DATA_FILES			= [ ('', ['README.rst','LICENSE']), ]
+PYTHON_REQUIRES		= '>=3.8'
 INSTALL_REQUIRES 	= [	'pyperclip>=1.5.27' ]
+EXTRAS_REQUIRE 		= {	'numpy': ['numpy']	}
 
 # Static info
 # -----------
@@ -45,8 +47,8 @@ CLASSIFIERS 		+= [
 						'Natural Language :: English',
 						'Operating System :: OS Independent',
 						'Programming Language :: Python',
-						'Programming Language :: Python :: 2',
 						'Programming Language :: Python :: 3',
+						'Programming Language :: Python :: 3 :: Only',
 						'Topic :: Security',
 						'Topic :: Utilities',
 					]
@@ -70,7 +72,9 @@ setup(
 	package_dir=PACKAGE_DIR,
 	package_data=PACKAGE_DATA,
 	data_files=DATA_FILES,
+	python_requires=PYTHON_REQUIRES,
 	install_requires=INSTALL_REQUIRES,
+	extras_require=EXTRAS_REQUIRE,
 	classifiers=CLASSIFIERS,
 	include_package_data=INC_PKG_DATA,
 	zip_safe=ZIP_SAFE )
\ No newline at end of file
@@ -12,4 +12,4 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-__all__ = ['pattern', 'utils', 'worddict']
\ No newline at end of file
+__all__ = ['batch', 'generator', 'ingest', 'parallel', 'pattern', 'policy', 'prefetch', 'rand', 'registry', 'server', 'stats', 'unique', 'utils', 'worddict']
\ No newline at end of file
@@ -12,10 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+IMPORT_TIME = time.time()
+
 import argparse
 import re
-import readline
-import pyperclip
 import sys
 from os import path
 
@@ -27,6 +28,12 @@ from .utils import *
 # =================
 DEFAULT_PATTERN = '%d[4]%s=[2]%W[6-10]'
 DEFAULT_PATTERN_NO_WORDS = re.sub(r'%W', r'%w', DEFAULT_PATTERN)
+DEFAULT_POLICY_PATTERN = '%{dsw+^}[16]'
+# Bulk output
+# ===========
+FRAMINGS = ('newline', 'nul', 'jsonl')
+WRITE_BATCH = 4096
+WRITE_BUFFER = 1<<20
 # Relavent Paths
 # ==============
 WORDS_FILE = path.join(path.dirname(path.abspath(__file__)), 'words', 'words.txt')
@@ -35,6 +42,10 @@ FALLBACK_WORDS_FILE = path.join(DEFAULT_WORDS_FILES_DIR, 'english.txt')
 
 
 def main():
+	# Subcommands with their own options, see `server.py`
+	if len(sys.argv) > 1 and sys.argv[1] in ('serve', 'loadtest'):
+		from . import server
+		return server.main(sys.argv[1:])
 	try:
 		return _main()
 	except KeyboardInterrupt:
@@ -42,6 +53,18 @@ def main():
 		return 1
 def _main():
 	args = parser().parse_args()
+	if args.prefetch is not None and not args.interactive:
+		printerr('`--prefetch` only applies to interactive mode, use it with `-i`')
+		return 1
+	if args.prefetch and args.stats:
+		printerr('`--stats` is not thread safe, and `--prefetch` generates in a background thread, so they cannot be used together')
+		return 1
+	timings = Timings(IMPORT_TIME) if args.timings else None
+	if args.stats:
+		from .stats import Stats
+		stats = Stats()
+	else:
+		stats = None
 
 	# WordDictionary ops
 	worddict = None
@@ -50,108 +73,301 @@ def _main():
 		WordDictionary.revert(WORDS_FILE)
 	# New worddict op `-w`
 	if args.worddict:
-		print('Generating new words file from file: %r' % args.worddict)
-		worddict = WordDictionary.setWordsFile(WORDS_FILE, args.worddict)
+		# With `-n`, stdout only holds the passwords
+		report = printerr if args.count is not None else print
+		report('%s words file from file: %r' % ('Adding to the' if args.append else 'Generating new', args.worddict))
+		with Timings.measure(timings, 'dictionary'):
+			worddict = WordDictionary.setWordsFile(WORDS_FILE, args.worddict, jobs=args.jobs,
+													progress=printProgress if sys.stderr.isatty() else None, append=args.append)
+		if worddict and worddict.ingest_stats:
+			if sys.stderr.isatty():
+				printerr()
+			report(worddict.ingest_stats.report())
 	# Default language worddict op `-l` 
 	elif args.language:
 		langdict_path = path.join(DEFAULT_WORDS_FILES_DIR, args.language.lower()+'.txt')
 		if path.isfile(langdict_path):
-			worddict = WordDictionary.setWordsFile(WORDS_FILE, langdict_path, formatted=True)
+			with Timings.measure(timings, 'dictionary'):
+				worddict = WordDictionary.setWordsFile(WORDS_FILE, langdict_path, formatted=True)
 		else: 
 			printerr('There is currently no dictionary for the language `%s`' % args.language)
 			printerr('Make sure you are using the native name of the language ('
 					+'i.e. `deutsch` instead of `german`), otherwise if the language you want to use isn\'t currently included, '
 					+'try updating with pip, or consider making your own file for your language and forking this project to include '
 					+'your language\'s dictionary (go to `https://github.com/nkrim/passwordgen` for more info)')
-	# Fallback/current/default worddict compiling
-	if not worddict:
-		try: 
-			worddict = WordDictionary(WORDS_FILE)
-		except FileNotFoundError:
-			worddict = None
-			printerr('Could not find words file at %r...' % WORDS_FILE)
-			# Attempt to restore from backup of previous words file
-			if path.isfile(WORDS_FILE+'.old'):
-				printerr('- Restoring from backup of previous words file:')
-				worddict = WordDictionary.setWordsFile(WORDS_FILE, WORDS_FILE+'.old', backup=False, formatted=True)
-				if not worddict:
-					printerr('Restoration from backup failed.')
-			# Attempt to yse
-			if not worddict and path.isfile(FALLBACK_WORDS_FILE):
-				printerr('- Loading fallback dictionary %r as new words file:' % path.basename(FALLBACK_WORDS_FILE))
-				worddict = WordDictionary.setWordsFile(WORDS_FILE, FALLBACK_WORDS_FILE, backup=False, formatted=True)
-				if not worddict:
-					printerr('Loading from fallback failed.')
-			if not worddict:
-				printerr('- Could not generate new words file, can continue as long as pattern does not use the `W` signifier')
+
+	# Dictionary for this call only `-d`
+	elif args.dictionary:
+		try:
+			with Timings.measure(timings, 'dictionary'):
+				worddict = openDictionary(args.dictionary)
+		except (KeyError, FileNotFoundError) as e:
+			printerr(e.args[0] if isinstance(e, KeyError) else e)
+			return 1
+
+	# Word filters `--blocklist` and `--word-regex`, applied as a view of whichever dictionary is used
+	try:
+		word_filter = wordFilter(args.blocklist, args.word_regex)
+	except (IOError, OSError, re.error) as e:
+		printerr('Could not set up the word filters: %s' % e)
+		return 1
+	# Word frequency weighting `--weighted` and `--top`, applied after the filters
+	def prepareDictionary(worddict):
+		if worddict and word_filter:
+			worddict = worddict.view(**word_filter)
+		if worddict and (args.weighted is not None or args.top is not None):
+			worddict = worddict.weighted(args.weighted if args.weighted is not None else 0.0, args.top)
+		return worddict
+	try:
+		worddict = prepareDictionary(worddict)
+	except ValueError as e:
+		printerr(e)
+		return 1
+
+	# Composition policy `--policy`
+	policy_rules = None
+	if args.policy is not None:
+		if args.stats:
+			printerr('`--stats` records pattern expressions, which a policy does not generate from, so it cannot be used with `--policy`')
+			return 1
+		from .policy import Policy
+		try:
+			policy_rules = Policy.parse(args.policy)
+		except ValueError as e:
+			printerr(e)
+			return 1
+
+	# The current/default worddict is only loaded once a pattern needs it
+	worddict_loaded = [bool(worddict)]
+	def compilePattern(pattern_str):
+		nonlocal worddict
+		def build():
+			# Patterns from `Pattern.compile` are shared, so a pattern recording `stats` gets its own instance
+			with Timings.measure(timings, 'pattern'):
+				if stats is None:
+					return Pattern.compile(pattern_str, worddict)
+				return Pattern(pattern_str, worddict, stats=stats)
+		pattern = build()
+		if pattern.uses_words() and not worddict_loaded[0]:
+			worddict_loaded[0] = True
+			with Timings.measure(timings, 'dictionary'):
+				worddict = prepareDictionary(loadWordDictionary())
+			if worddict:
+				pattern = build()
+		if policy_rules is not None:
+			pattern = Policy(pattern, **policy_rules)
+		return pattern
 
 	# Set pattern as default, if necessary
+	default = False
 	if args.pattern is None:
-		if worddict:
-			args.pattern = DEFAULT_PATTERN 
-		else:
-			printerr('Using an augmented default pattern to accomadate for the lack of a words file (%W signifiers are changed to %w)')
-			args.pattern = DEFAULT_PATTERN_NO_WORDS
+		args.pattern = DEFAULT_PATTERN if policy_rules is None else DEFAULT_POLICY_PATTERN
+		default = True
 	# Throw error for empty-string pattern
 	elif args.pattern == '':
-		if worddict:
-			printerr('Cannot use an empty string as the pattern. Continuing using default pattern: `%s`' % DEFAULT_PATTERN)
-			args.pattern = DEFAULT_PATTERN
-		else:
-			printerr('Cannot use an empty string as the pattern. Continuing using default no-words pattern: `%s`' % DEFAULT_PATTERN_NO_WORDS)
-			args.pattern = DEFAULT_PATTERN_NO_WORDS
+		printerr('Cannot use an empty string as the pattern. Continuing using default pattern: `%s`' % DEFAULT_PATTERN)
+		args.pattern = DEFAULT_PATTERN
+		default = True
 
 	# Parse pattern
 	try:
-		pattern = Pattern(args.pattern, worddict)
+		pattern = compilePattern(args.pattern)
 	except ValueError as e:
 		printerr('Error when compiling pattern with `%s`: %s' % (args.pattern, e))
 		return 1
+	if default and not worddict and policy_rules is None:
+		printerr('Using an augmented default pattern to accomadate for the lack of a words file (%W signifiers are changed to %w)')
+		args.pattern = DEFAULT_PATTERN_NO_WORDS
+		pattern = compilePattern(args.pattern)
 
+	# Reproducible mode `--seed`
+	if args.seed is not None:
+		if args.start < 0:
+			printerr('`--start` cannot be negative')
+			return 1
+		printerr('Using seed %r: these passwords can be regenerated by anyone with the seed, NEVER use them as real credentials' % args.seed)
+	index = [args.start]
+	# Background producer for `-i` with `--prefetch`
+	prefetcher = None
+	def generateOne():
+		if prefetcher is not None:
+			return prefetcher.get()
+		if args.seed is None:
+			return pattern.generate()
+		index[0] += 1
+		return pattern.generate_at(args.seed, index[0]-1)
+
+	# Report keyspace and entropy instead of generating
+	if args.entropy:
+		try:
+			print('  Pattern: `%s`' % pattern)
+			if pattern.keyspace_is_exact():
+				print('  Keyspace: %d' % pattern.keyspace())
+				print('  Entropy: %.2f bits' % pattern.entropy())
+			else:
+				# Outputs of the expressions can run together, so both are over-counted
+				print('  Keyspace: at most %d' % pattern.keyspace())
+				print('  Entropy: at most %.2f bits (expressions of varying length can produce the same password)' % pattern.entropy())
+		except ValueError as e:
+			printerr('Error when computing entropy: %s' % e)
+			return 1
 	# Generate password(s)
-	if args.interactive:
+	elif args.count is not None:
+		try:
+			if args.unique:
+				passwords = pattern.generate_unique(args.count, args.jobs, args.seed, args.start)
+			elif args.seed is not None or (args.jobs and args.jobs > 1):
+				passwords = pattern.generate_parallel(args.count, args.jobs, not args.unordered, args.seed, args.start)
+			else:
+				passwords = pattern.generate_many(args.count)
+			with Timings.measure(timings, 'generation'):
+				if args.output:
+					with open(args.output, 'w', buffering=WRITE_BUFFER) as f:
+						writePasswords(passwords, f, args.framing)
+				else:
+					writePasswords(passwords, sys.stdout, args.framing)
+		except ValueError as e:
+			printerr('Error when generating password: %s' % e)
+			return 1
+		except IOError as e:
+			printerr('Could not write passwords: %s' % e)
+			return 1
+	elif args.interactive:
+		# Line editing for `input`, where available
+		try:
+			import readline
+		except ImportError:
+			pass
 		print('Entering interactive mode. Press enter to generate a new password. Enter a new pattern at any time to use instead, if valid.')
 		print('  Enter `q` to quit')
 		print('  Generating using pattern: `%s`' % pattern)
+		if args.prefetch and args.seed is None:
+			from .prefetch import Prefetcher
+			prefetcher = Prefetcher(pattern, args.prefetch)
 		quit = False
 		while not quit:
 			try:
-				out = pattern.generate()
+				with Timings.measure(timings, 'generation'):
+					out = generateOne()
 			except ValueError as e:
 				printerr('Error when generating password: %s' % e)
 				return 1
 			if args.copy:
-				pyperclip.copy(out)
-				print('  Copying to clipboard')
+				copyToClipboard(out)
 			print(out)
-			if sys.version_info[0] < 3:
-				instr = raw_input('> ').strip()
-			else:
-				instr = input('> ').strip()
+			instr = input('> ').strip()
 			if instr:
 				if instr == 'q':
 					quit = True
 				else:
 					try:
-						newpattern = Pattern(instr, worddict)
+						newpattern = compilePattern(instr)
 					except ValueError as e:
 						print('  Enter `q` to quit')
 						printerr('  Error when compiling pattern with `%s`: %s' % (instr, e))
 					else:
 						pattern = newpattern
+						if prefetcher is not None:
+							prefetcher.set_pattern(pattern)
 						print('  Enter `q` to quit')
 						print('  Generating using pattern: `%s`' % pattern)
+		if prefetcher is not None:
+			prefetcher.close()
 
 	else:
 		print('  Generating using pattern: `%s`' % pattern)
-		out = pattern.generate()
+		try:
+			with Timings.measure(timings, 'generation'):
+				out = generateOne()
+		except ValueError as e:
+			printerr('Error when generating password: %s' % e)
+			return 1
 		if args.copy:
-			pyperclip.copy(out)
-			print('  Copying to clipboard')
+			copyToClipboard(out)
 		print(out)
+	if timings:
+		timings.report()
+	if stats:
+		printerr(stats.report())
 	return 0
+
+def loadWordDictionary():
+	# Load the current words file, falling back to its backup and then the default dictionary
+	try: 
+		return WordDictionary(WORDS_FILE)
+	except FileNotFoundError:
+		worddict = None
+		printerr('Could not find words file at %r...' % WORDS_FILE)
+		# Attempt to restore from backup of previous words file
+		if path.isfile(WORDS_FILE+'.old'):
+			printerr('- Restoring from backup of previous words file:')
+			worddict = WordDictionary.setWordsFile(WORDS_FILE, WORDS_FILE+'.old', backup=False, formatted=True)
+			if not worddict:
+				printerr('Restoration from backup failed.')
+		# Attempt to yse
+		if not worddict and path.isfile(FALLBACK_WORDS_FILE):
+			printerr('- Loading fallback dictionary %r as new words file:' % path.basename(FALLBACK_WORDS_FILE))
+			worddict = WordDictionary.setWordsFile(WORDS_FILE, FALLBACK_WORDS_FILE, backup=False, formatted=True)
+			if not worddict:
+				printerr('Loading from fallback failed.')
+		if not worddict:
+			printerr('- Could not generate new words file, can continue as long as pattern does not use the `W` signifier')
+		return worddict
+
+def openDictionary(name):
+	# Dictionary selected with `-d`, by name or by path to a formatted words file
+	from .registry import DictionaryRegistry
+	registry = DictionaryRegistry(DEFAULT_WORDS_FILES_DIR)
+	if name not in registry and path.isfile(name):
+		registry.register(name, name)
+	return registry.get(name)
+
+def wordFilter(blocklist_file=None, regex=None):
+	# Arguments to `WordDictionary.view` for `--blocklist` and `--word-regex`, or None without filters
+	if blocklist_file is None and regex is None:
+		return None
+	word_filter = {'regex': re.compile(regex).pattern if regex is not None else None}
+	if blocklist_file is not None:
+		with open(blocklist_file, 'r') as f:
+			word_filter['blocklist'] = {line.strip() for line in f if line.strip()}
+	return word_filter
+
+def printProgress(stats):
+	printerr('\r  Reading %r: %3d%%' % (path.basename(stats.path), 100*stats.read_bytes//max(1, stats.total_bytes)), end='')
+
+def copyToClipboard(out):
+	# pyperclip is only imported when the clipboard is actually used
+	import pyperclip
+	pyperclip.copy(out)
+	print('  Copying to clipboard')
+
+def writePasswords(passwords, f, framing='newline'):
+	# Write passwords in large batches, with no other output
+	if framing == 'jsonl':
+		import json
+		passwords = (json.dumps(p) for p in passwords)
+	sep = '\0' if framing == 'nul' else '\n'
+	batch = []
+	for p in passwords:
+		batch.append(p)
+		if len(batch) >= WRITE_BATCH:
+			f.write(sep.join(batch)+sep)
+			batch = []
+	if batch:
+		f.write(sep.join(batch)+sep)
+	f.flush()
 		
 
+def nonNegativeInt(value):
+	# Argument type for counts and sizes, which can be 0
+	try:
+		n = int(value)
+	except ValueError:
+		n = -1
+	if n < 0:
+		raise argparse.ArgumentTypeError('%r is not a non-negative integer' % value)
+	return n
+
 def parser():
 	parser = argparse.ArgumentParser(	description='Generate random passwords using a pattern ot specify the general format',
 										epilog=howto(),
@@ -164,10 +380,40 @@ def parser():
 							action='store_true',
 							help='Whenever a password is succesfully generated (in either singlue-use mode or interactive mode), '
 								+'the string will be copied to your clipboard (may require external libraries, depending on platform')
-	parser.add_argument(	'-i', '--interactive',
+	mode_group = parser.add_mutually_exclusive_group()
+	mode_group.add_argument(	'-i', '--interactive',
 							action='store_true',
 							help='Launches in interactive mode, where passwords of the given pattern are continuously printed after each input, '
 								+'and if a valid pattern is given as input at any time, then the new pattern will be used going forward (enter `q` to exit)')
+	mode_group.add_argument(	'-n', '--count',
+							type=nonNegativeInt,
+							help='Generates the given number of passwords and streams them to stdout (or to the file given with `-o`), '
+								+'without printing anything else')
+	parser.add_argument(	'--prefetch',
+							type=nonNegativeInt,
+							metavar='SIZE',
+							help='In interactive mode, keeps up to the given number of passwords generated ahead in the background while '
+								+'waiting for input, so each one is shown without delay (the buffer is refilled when a new pattern is entered; '
+								+'0 turns it off, and it is not used with `--seed`)')
+	parser.add_argument(	'-o', '--output',
+							type=str,
+							help='The file to write passwords to when using `-n` (defaults to stdout)')
+	parser.add_argument(	'-f', '--framing',
+							choices=FRAMINGS,
+							default='newline',
+							help='How passwords are separated when using `-n`: one per line (`newline`, the default), '
+								+'NUL-terminated (`nul`), or one JSON string per line (`jsonl`)')
+	parser.add_argument(	'-u', '--unique',
+							action='store_true',
+							help='When using `-n`, guarantees that no password is repeated in the batch '
+								+'(fails right away if the pattern cannot produce enough distinct passwords)')
+	parser.add_argument(	'-j', '--jobs',
+							type=int,
+							help='The number of worker processes used to generate passwords when using `-n` (defaults to 1), '
+								+'or to read the file given with `-w` (defaults to one per core for large files)')
+	parser.add_argument(	'--unordered',
+							action='store_true',
+							help='When using `-j`, writes passwords as soon as each worker finishes a chunk instead of keeping the chunks in order')
 	worddict_group = parser.add_mutually_exclusive_group()
 	worddict_group.add_argument(	'-w', '--worddict',
 							type=str,
@@ -181,6 +427,58 @@ def parser():
 								+'words.txt file using that language\'s words file, if it exists (if there is no default file for your language, please '
 								+'consider making your own file for your language and forking this project to include your language\'s dictionary; '
 								+'go to `https://github.com/nkrim/passwordgen` for more info)')
+	worddict_group.add_argument(	'-d', '--dictionary',
+							type=str,
+							help='Uses the named dictionary (a language with a pre-made words file, or the path to a formatted words file) '
+								+'for this call only, without replacing the current words.txt file')
+	parser.add_argument(	'-a', '--append',
+							action='store_true',
+							help='When using `-w`, adds the words from the file to the current `words.txt` file instead of replacing it '
+								+'(the previous version is still copied to words.txt.old)')
+	parser.add_argument(	'--seed',
+							type=str,
+							help='Generates a reproducible stream of passwords from the given seed, FOR TEST FIXTURES ONLY: anyone with the seed '
+								+'can regenerate them, so never use them as real credentials (not counted by `--stats`)')
+	parser.add_argument(	'--start',
+							type=int,
+							default=0,
+							help='With `--seed`, the number of the first password to generate from the stream (defaults to 0)')
+	parser.add_argument(	'-p', '--policy',
+							type=str,
+							help='Only generates passwords meeting the given composition rules, such as `digits=2,symbols=1,upper=1,repeat=2` '
+								+'(minimum digits, symbols, lowercase and uppercase letters, and the most times any character may appear). '
+								+'Every valid password is equally likely, and no draws are thrown away. The pattern must be a single expression '
+								+'without the `W` signifier or the `=` or `~` flags, and `^` only together with `+` (defaults to `{}`)'.format(re.sub(r'%',r'%%',DEFAULT_POLICY_PATTERN)))
+	parser.add_argument(	'--blocklist',
+							type=str,
+							help='Never uses the words listed in the given file (one per line, ignoring case) for the `W` signifier')
+	parser.add_argument(	'--word-regex',
+							type=str,
+							help='Only uses words containing a match for the given regular expression for the `W` signifier '
+								+'(for example `^[a-z]+$` for words without uppercase letters)')
+	parser.add_argument(	'--weighted',
+							type=float,
+							metavar='EXPONENT',
+							help='Draws words for the `W` signifier by how often they appeared in the text given to `-w`, each word with a '
+								+'probability proportional to its count raised to the given exponent (1 follows the text, 0 is uniform, and values '
+								+'in between favor common words less). Common words are easier to guess, use `-e` to see the entropy left')
+	parser.add_argument(	'--top',
+							type=int,
+							metavar='N',
+							help='Only uses the N words that appeared most often in the text given to `-w` for the `W` signifier '
+								+'(uniformly, unless `--weighted` is also used)')
+	parser.add_argument(	'-e', '--entropy',
+							action='store_true',
+							help='Prints the number of distinct passwords the pattern can produce and their entropy in bits, '
+								+'computed exactly from the pattern instead of generating a password (only upper bounds when more than one expression '
+								+'has a range of lengths, as their outputs can run together)')
+	parser.add_argument(	'--stats',
+							action='store_true',
+							help='Reports per-expression call counts, time and pool sizes, bytes of randomness used and word samples drawn '
+								+'(printed to stderr; not collected from `-j` worker processes)')
+	parser.add_argument(	'--timings',
+							action='store_true',
+							help='Reports how long imports, loading the word dictionary, compiling the pattern and generating took (printed to stderr)')
 	parser.add_argument(	'-R', '--revert',
 							action='store_true',
 							help='Reverts the worddict file at `words.txt` with the backup file, if there is one '
@@ -0,0 +1,150 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Vectorized batch generation, used by `Pattern.generate_many` when NumPy is installed
+
+# NumPy is only imported the first time a batch could use it
+numpy = None
+_imported = False
+
+# Smallest batch worth vectorizing, and the number of passwords generated per chunk
+MIN_BATCH = 1024
+CHUNK_SIZE = 1<<16
+
+def available():
+	global numpy, _imported
+	if not _imported:
+		_imported = True
+		try:
+			import numpy
+		except ImportError:
+			numpy = None
+	return numpy is not None
+
+def generate(pattern, n):
+	# Yield `n` passwords from `pattern`, one chunk at a time
+	if not available():
+		raise ImportError('NumPy is required for vectorized generation')
+	rng = pattern.rng.local()
+	while n > 0:
+		count = min(n, CHUNK_SIZE)
+		if pattern.stats is not None:
+			columns = pattern.stats.columns(pattern, count, column)
+		else:
+			columns = [column(e, count, rng) for e in pattern.expressions]
+		for out in map(''.join, zip(*columns)):
+			yield out
+		n -= count
+
+def column(expression, n, rng):
+	# Generate `n` outputs of a single expression
+	plans = expression.plans
+	if len(plans) == 1:
+		return plan_column(expression, plans[0], n, rng)
+	# Apply the '~' (choose sig) flag row by row
+	choices = randbelow(rng, len(plans), n)
+	out = [None]*n
+	for i, plan in enumerate(plans):
+		rows = numpy.flatnonzero(choices == i).tolist()
+		if rows:
+			for row, value in zip(rows, plan_column(expression, plan, len(rows), rng)):
+				out[row] = value
+	return out
+
+def plan_column(expression, plan, n, rng):
+	if plan.words:
+		return word_column(expression, plan, n, rng)
+	lower, upper = expression.length_lower, expression.length_upper
+	if upper == 0:
+		return ['']*n
+	pool = numpy.frombuffer(plan.pool.encode('ascii'), dtype=numpy.uint8)
+	lengths = lower + randbelow(rng, upper-lower+1, n) if upper > lower else numpy.full(n, lower)
+	# Apply the '=' (repeat same) flag
+	if plan.repeat:
+		chars = numpy.repeat(pool[randbelow(rng, len(pool), n)][:, None], upper, axis=1)
+	else:
+		chars = pool[randbelow(rng, len(pool), (n, upper))]
+	# Apply the '^' (single capital) flag
+	if plan.cap_mode == 1:
+		lower_mask = (chars >= ord('a')) & (chars <= ord('z')) & (numpy.arange(upper) < lengths[:, None])
+		counts = lower_mask.sum(axis=1)
+		rows = numpy.flatnonzero(counts)
+		if len(rows):
+			picks = randbelow_each(rng, counts[rows])
+			cols = numpy.argmax(lower_mask[rows].cumsum(axis=1) > picks[:, None], axis=1)
+			chars[rows, cols] -= ord('a')-ord('A')
+	# Split the character matrix into strings
+	data = chars.tobytes().decode('ascii')
+	return [data[i*upper:i*upper+length] for i, length in enumerate(lengths.tolist())]
+
+def word_column(expression, plan, n, rng):
+	worddict = expression.worddict
+	if not worddict:
+		raise ValueError('Attempted to use the `W` signifier while no word dictionary is loaded, load a dictionary with the `-w` or `-l` command options')
+	if expression.word_any_length:
+		start, stop = worddict.wordRange()
+	else:
+		start, stop = worddict.wordRange(expression.length_lower, expression.length_upper)
+	word = worddict.index.word
+	if worddict.weights is not None:
+		indexes = alias_column(rng, worddict.aliasTable(start, stop), n)
+	else:
+		indexes = start + randbelow(rng, stop-start, n)
+	words = [word(i) for i in indexes.tolist()]
+	rng.words_drawn += n
+	if plan.cap_mode:
+		capitalize = expression.capitalize
+		words = [capitalize(w, plan.cap_mode, rng) for w in words]
+	return words
+
+def alias_column(rng, table, n):
+	# `n` draws from a `WordDictionary.AliasTable`, made the same way as `AliasTable.sample`
+	bits = table.bits
+	r = randbelow(rng, len(table) << bits, n).astype(numpy.uint64)
+	slots = (r >> numpy.uint64(bits)).astype(numpy.int64)
+	thresholds = numpy.frombuffer(table.thresholds, dtype=numpy.uint64)
+	aliases = numpy.frombuffer(table.aliases, dtype=numpy.uint32)
+	keep = (r & numpy.uint64((1 << bits)-1)) < thresholds[slots]
+	return table.offset + numpy.where(keep, slots, aliases[slots])
+
+def randbelow(rng, n, shape):
+	# Unbiased integers in `[0, n)` drawn from `rng`'s bytes by rejection sampling
+	size = int(numpy.prod(shape))
+	if n == 1:
+		return numpy.zeros(shape, dtype=numpy.int64)
+	dtype = numpy.dtype('<u1' if n <= 1<<8 else '<u2' if n <= 1<<16 else '<u4' if n <= 1<<32 else '<u8')
+	span = 1 << (8*dtype.itemsize)
+	limit = span - span%n
+	out = numpy.empty(size, dtype=numpy.int64)
+	filled = 0
+	while filled < size:
+		need = size-filled
+		draws = numpy.frombuffer(rng.randbytes(dtype.itemsize*(need*span//limit + 16)), dtype=dtype)
+		draws = draws[draws < limit][:need]
+		out[filled:filled+len(draws)] = draws % n
+		filled += len(draws)
+	return out.reshape(shape)
+
+def randbelow_each(rng, ns):
+	# Unbiased integers in `[0, ns[i])` for every row `i`, redrawing only rejected rows
+	ns = numpy.asarray(ns, dtype=numpy.uint64)
+	limits = (1<<32) - (1<<32) % ns
+	out = numpy.empty(len(ns), dtype=numpy.int64)
+	pending = numpy.arange(len(ns))
+	while len(pending):
+		draws = numpy.frombuffer(rng.randbytes(4*len(pending)), dtype='<u4').astype(numpy.uint64)
+		accepted = draws < limits[pending]
+		out[pending[accepted]] = draws[accepted] % ns[pending[accepted]]
+		pending = pending[~accepted]
+	return out
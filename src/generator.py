@@ -0,0 +1,86 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Unique, parallel and reproducible generation shared by `pattern.Pattern` and `policy.Policy`
+
+from .rand import CounterRandom
+
+class Generator:
+	"""Base of every password source, built on two methods of the subclass.
+
+	`_generate(rng)` returns one password drawn from `rng`, and `generate_many(n)` streams `n`
+	passwords from the source's own randomness. Subclasses also provide `keyspace()`, for
+	`generate_unique` (overriding `keyspace_is_exact` if it can over-count), and must pickle as a recipe to rebuild them (`__reduce__`), which is how
+	`parallel` hands them to workers when it cannot fork.
+	"""
+	# Batches smaller than this are generated in place by `agenerate_many`
+	async_inline = 256
+
+	def generate_unique(self, n, jobs=None, seed=None, start=0):
+		# Stream of `n` distinct passwords, failing fast if the keyspace is too small
+		from . import parallel, unique
+		if jobs and jobs > 1:
+			# One pool for the whole batch, its stream read until there are `n` distinct passwords
+			source = parallel.stream(self, jobs, parallel.chunk_size(n, 2*jobs), seed, start)
+		elif seed is not None:
+			# Consecutive slices of the seeded stream, skipping repeats
+			position = [start]
+			def source(k):
+				position[0] += k
+				return self.generate_range(seed, position[0]-k, position[0])
+		else:
+			source = self.generate_many
+		return unique.generate(source, n, self.keyspace(), upper_bound=not self.keyspace_is_exact())
+
+	def keyspace_is_exact(self):
+		# Whether `keyspace()` (and `entropy()`) are exact, rather than upper bounds
+		return True
+
+	def generate_parallel(self, n, jobs=None, ordered=True, seed=None, start=0):
+		# Stream of `n` passwords generated across `jobs` processes (defaults to one per core),
+		# or passwords `start` to `start+n` of the stream for `seed` (see `generate_range`)
+		if seed is not None and not (jobs and jobs > 1):
+			return self.generate_range(seed, start, start+n)
+		from . import parallel
+		return parallel.generate(self, n, jobs, ordered, seed, start)
+
+	# Reproducible generation, NOT for real credentials: anyone with the seed can regenerate
+	# the passwords. Password #N depends only on the seed, N, the pattern and the dictionary,
+	# never on how many passwords were generated before it or in which process.
+
+	def generate_at(self, seed, index):
+		return self._generate(CounterRandom(seed, index))
+
+	def generate_range(self, seed, start, stop):
+		# Passwords `start` to `stop-1` of the stream for `seed`
+		rng = CounterRandom(seed)
+		for index in range(start, stop):
+			rng.seek(index)
+			yield self._generate(rng)
+
+	def generate_shard(self, seed, n, shard, shards):
+		# Slice `shard` of `shards` (counting from 0) of the first `n` passwords for `seed`; the
+		# slices are disjoint, and together hold every password in order
+		if not 0 <= shard < shards:
+			raise ValueError('`shard` must satisfy: 0 <= `shard` < `shards`')
+		return self.generate_range(seed, n*shard//shards, n*(shard+1)//shards)
+
+	async def agenerate_many(self, n, executor=None):
+		# List of `n` passwords, generated in `executor` (the loop's default if None) unless the batch is small
+		if n < self.async_inline:
+			return list(self.generate_many(n))
+		import asyncio
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(executor, lambda: list(self.generate_many(n)))
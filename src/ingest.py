@@ -0,0 +1,178 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Streaming, bounded-memory conversion of raw text into a formatted words file
+
+import heapq
+import os
+import re
+import string
+import time
+from collections import Counter, deque
+from itertools import groupby
+from operator import itemgetter
+from tempfile import TemporaryFile
+
+from .utils import *
+
+# Characters read per chunk (chunks are cut between words)
+CHUNK_SIZE = 1<<22
+# Unique words held in memory before they are spilled to a sorted run on disk
+MAX_WORDS = 1<<20
+
+sub_re = re.compile(r'[\-\']')
+split_re = re.compile(r'[^a-zA-Z]+')
+# Characters that can continue a word: letters, and the hyphens and apostrophes removed before splitting
+word_chars = string.ascii_letters+'-\''
+
+def tokenize(text):
+	# Same rules as `WordDictionary.parse`: hyphens and apostrophes are removed, then non-letters split words.
+	# Returns how many times each word appears
+	words = Counter(split_re.split(sub_re.sub('', text)))
+	words.pop('', None)
+	return words
+
+def itemkey(item):
+	# Order of the formatted words file for `(word, count)` pairs: by length, then alphabetically
+	return (len(item[0]), item[0])
+
+def chunks(f, size=CHUNK_SIZE):
+	# Blocks of about `size` characters, each cut after its last character that ends a word, so
+	# no word is split between chunks whether or not the text has newlines
+	rest = []
+	while True:
+		block = f.read(size)
+		if not block:
+			break
+		cut = len(block.rstrip(word_chars))
+		if cut:
+			yield ''.join(rest)+block[:cut]
+			rest = [block[cut:]]
+		else:
+			# Still inside one word, kept as pieces to join once it ends
+			rest.append(block)
+	rest = ''.join(rest)
+	if rest:
+		yield rest
+
+
+class IngestStats:
+	def __init__(self, path):
+		self.path = path
+		self.total_bytes = os.path.getsize(path)
+		self.read_bytes = 0
+		self.runs = 0
+		self.length_counts = []
+		self.start = time.time()
+		self.elapsed = 0
+
+	def words(self):
+		return sum(self.length_counts)
+
+	def report(self):
+		lines = ['  Read %d bytes in %.1fs (%d disk runs)' % (self.read_bytes, self.elapsed, self.runs),
+				'  %d unique words' % self.words()]
+		lines += ['    length %2d: %d' % (length, count) for length, count in enumerate(self.length_counts) if count]
+		return '\n'.join(lines)
+
+
+def ingest(file_path, words_file, jobs=None, progress=None, max_words=MAX_WORDS, counts_file=None):
+	"""Tokenize `file_path` into a formatted words file at `words_file`.
+
+	The input is read in chunks that are tokenized in `jobs` processes (by default one per
+	core for large inputs). Unique words are counted in memory up to `max_words`, then
+	spilled to sorted runs on disk, and all runs are merged straight into `words_file`.
+	If `counts_file` is given, the number of times each word appears is written there, in the
+	same layout as `words_file` (see `WordDictionary.countsFile`).
+	`progress`, if given, is called with the stats after every chunk. Returns `IngestStats`.
+	"""
+	stats = IngestStats(file_path)
+	if jobs is None:
+		jobs = (os.cpu_count() or 1) if stats.total_bytes > 4*CHUNK_SIZE else 1
+	runs = []
+	words = Counter()
+	with open(file_path, 'r') as f:
+		for chunk_words, chunk_size in tokenized(chunks(f), jobs):
+			stats.read_bytes += chunk_size
+			words.update(chunk_words)
+			if len(words) >= max_words:
+				runs.append(spill(words))
+				words = Counter()
+			if progress:
+				progress(stats)
+	stats.runs = len(runs)
+	try:
+		merged = heapq.merge(*([readrun(run) for run in runs] + [sorted(words.items(), key=itemkey)]), key=itemkey)
+		with open(words_file, 'w') as out:
+			if counts_file:
+				with open(counts_file, 'w') as counts_out:
+					stats.length_counts = write(merged, out, counts_out)
+			else:
+				stats.length_counts = write(merged, out)
+	finally:
+		for run in runs:
+			run.close()
+	stats.elapsed = time.time()-stats.start
+	return stats
+
+def tokenized(chunk_iter, jobs):
+	# Yield `(words, size)` per chunk, keeping at most two chunks per worker in flight
+	if jobs <= 1:
+		for chunk in chunk_iter:
+			yield tokenize(chunk), len(chunk)
+		return
+	import multiprocessing
+	pool = multiprocessing.Pool(jobs)
+	try:
+		pending = deque()
+		for chunk in chunk_iter:
+			pending.append((pool.apply_async(tokenize, (chunk,)), len(chunk)))
+			if len(pending) >= 2*jobs:
+				result, size = pending.popleft()
+				yield result.get(), size
+		while pending:
+			result, size = pending.popleft()
+			yield result.get(), size
+	finally:
+		pool.terminate()
+
+def spill(words):
+	run = TemporaryFile('w+')
+	for w, count in sorted(words.items(), key=itemkey):
+		run.write('%s %d\n' % (w, count))
+	run.seek(0)
+	return run
+
+def readrun(run):
+	for line in run:
+		w, count = line.split()
+		yield w, int(count)
+
+def write(words, out, counts_out=None):
+	# Write sorted `(word, count)` pairs as one comma-separated line per length, adding up the
+	# counts of repeated words. `counts_out`, if given, gets the counts in the same layout
+	length_counts = [0]
+	first = True
+	for w, group in groupby(words, key=itemgetter(0)):
+		if len(w) >= len(length_counts):
+			sep = '\n'*(len(w)-len(length_counts)+(0 if first else 1))
+			length_counts += [0]*(len(w)-len(length_counts)+1)
+		else:
+			sep = ','
+		out.write(sep+w)
+		if counts_out is not None:
+			counts_out.write(sep+str(sum(count for _, count in group)))
+		length_counts[len(w)] += 1
+		first = False
+	return length_counts
@@ -0,0 +1,109 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Multi-process batch generation, used by `Generator.generate_parallel` and `generate_unique`
+
+import multiprocessing
+import os
+from collections import deque
+
+# Largest number of passwords handed to a worker at once
+CHUNK_SIZE = 1<<16
+
+# The pattern each worker generates from. With the `fork` start method it is set in the
+# parent before the pool starts, so workers share it (and its word dictionary) copy-on-write
+_pattern = None
+
+def _init(source=None):
+	global _pattern
+	if source is not None:
+		# No fork: the pattern (or policy) was pickled as its source, and is rebuilt once per worker
+		_pattern = source
+	# Every worker draws from its own independently seeded randomness source
+	_pattern.rng = _pattern.rng.spawn()
+
+def _work(n):
+	return list(_pattern.generate_many(n))
+
+def _work_range(task):
+	seed, start, stop = task
+	return list(_pattern.generate_range(seed, start, stop))
+
+def chunk_size(n, jobs):
+	# Chunks small enough to keep every worker busy on a batch of `n`
+	return max(1, min(CHUNK_SIZE, -(-n // (4*jobs))))
+
+def chunks(n, jobs):
+	size = chunk_size(n, jobs)
+	while n > 0:
+		yield min(n, size)
+		n -= size
+
+def ranges(seed, start, n, jobs):
+	for size in chunks(n, jobs):
+		yield (seed, start, start+size)
+		start += size
+
+def _pool(pattern, jobs):
+	global _pattern
+	if 'fork' in multiprocessing.get_all_start_methods():
+		context = multiprocessing.get_context('fork')
+		_pattern = pattern
+		initargs = ()
+	else:
+		context = multiprocessing.get_context()
+		initargs = (pattern,)
+	return context.Pool(jobs, initializer=_init, initargs=initargs)
+
+def generate(pattern, n, jobs=None, ordered=True, seed=None, start=0):
+	# Yield `n` passwords generated by `jobs` worker processes, in chunk order if `ordered`.
+	# With a `seed`, workers generate disjoint slices of its stream from password `start` on
+	global _pattern
+	jobs = jobs or os.cpu_count() or 1
+	pool = _pool(pattern, jobs)
+	try:
+		work = pool.imap if ordered else pool.imap_unordered
+		if seed is None:
+			tasks = work(_work, chunks(n, jobs))
+		else:
+			tasks = work(_work_range, ranges(seed, start, n, jobs))
+		for chunk in tasks:
+			for out in chunk:
+				yield out
+	finally:
+		pool.terminate()
+		_pattern = None
+
+def stream(pattern, jobs=None, size=CHUNK_SIZE, seed=None, start=0):
+	# Endless version of `generate` (always in order) on a single pool, for callers that do not
+	# know how many passwords they need. One chunk per worker, plus one, is in flight at a time
+	global _pattern
+	jobs = jobs or os.cpu_count() or 1
+	pool = _pool(pattern, jobs)
+	def submit():
+		nonlocal start
+		if seed is None:
+			return pool.apply_async(_work, (size,))
+		start += size
+		return pool.apply_async(_work_range, ((seed, start-size, start),))
+	try:
+		pending = deque(submit() for _ in range(jobs+1))
+		while True:
+			chunk = pending.popleft().get()
+			pending.append(submit())
+			for out in chunk:
+				yield out
+	finally:
+		pool.terminate()
+		_pattern = None
@@ -12,11 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import random
+import math
 import re
-from itertools import repeat
+import threading
+from collections import OrderedDict, namedtuple
 
-class Pattern:
+from . import batch
+from .generator import Generator
+from .rand import DEFAULT_RANDOM
+
+class Pattern(Generator):
+	"""A compiled password pattern.
+
+	A pattern is never modified by generating, so one instance (for example from
+	`Pattern.compile`) can be shared between threads: with the default randomness source
+	every thread draws from its own buffer. Custom sources must be wrapped in
+	`rand.ThreadLocalRandom` to be shared the same way. `stats`, when set, is not thread safe.
+	"""
 	all_sigs = {'d', 's', 'w', 'W', 'c'}
 	all_flags = {'~', '=', '+', '^'}
 	expression_re = re.compile((	r'%(?:'
@@ -36,13 +48,21 @@ class Pattern:
 		'w': {chr(ord('a')+i) for i in range(0,26)},
 	}
 	pools_dict['c'] = {c for _, pool in pools_dict.items() for c in pool}
+	lowercase = frozenset(pools_dict['w'])
+
+	# Precomputed generation step for one signifier choice of an expression
+	# - `words`: draw a word from the dictionary instead of characters from `pool`
+	# - `pool`: sorted character pool, with per-character capitalization already applied
+	# - `repeat`: repeat a single drawn character (the '=' flag)
+	# - `cap_mode`: capitalization left to apply after drawing
+	Plan = namedtuple('Plan', ['words', 'pool', 'repeat', 'cap_mode'])
 
 	class Expression:
 		def __init__(self, signifiers, flags='', length_lower=1, length_upper=None, word_any_length=False, worddict=None):
 			# Fix defaults
 			# ------------
 			if length_upper == None:
-				length_upper = lenth_lower
+				length_upper = length_lower
 
 			# Check values
 			# ------------
@@ -65,6 +85,9 @@ class Pattern:
 			self.length_upper = length_upper
 			self.word_any_length = word_any_length
 			self.worddict = worddict
+			self.plans = self.compile()
+			self._outcomes = None
+			self._chars = None
 
 		def __str__(self):
 			out = '%{}{}'.format(''.join(self.signifiers), ''.join(self.flags))
@@ -77,59 +100,224 @@ class Pattern:
 				out += ']'
 			return out
 
-		def generate(self):
-			# Set flag mode variables
+		def compile(self):
+			# Build the immutable generation plan, one entry per signifier choice
 			CHOOSE_SIG = '~' in self.flags
 			REPEAT_EQ = '=' in self.flags
 			CAP_MODE = 0 + (1 if '^' in self.flags else 0) + (2 if '+' in self.flags else 0)
-			# Apply the '~' (choose sig) flag
 			if CHOOSE_SIG:
-				sigs = {random.choice(tuple(self.signifiers))}
+				sig_choices = [{sig} for sig in sorted(self.signifiers)]
 			else:
-				sigs = self.signifiers
+				sig_choices = [self.signifiers]
+			plans = []
+			for sigs in sig_choices:
+				if 'W' in sigs:
+					plans.append(Pattern.Plan(True, '', False, CAP_MODE))
+					continue
+				pool = ''.join(sorted({c for sig in sigs for c in Pattern.pools_dict[sig]}))
+				# Capitalization that applies to every character independently is folded into the pool
+				if REPEAT_EQ:
+					CAP = 3 if CAP_MODE == 3 else 2 if CAP_MODE else 0
+				else:
+					CAP = CAP_MODE
+				if CAP == 3:
+					pool = ''.join(c+(c.upper() if c in Pattern.lowercase else c) for c in pool)
+				elif CAP == 2:
+					pool = pool.upper()
+				plans.append(Pattern.Plan(False, pool, REPEAT_EQ, 1 if CAP == 1 else 0))
+			return tuple(plans)
+
+		def generate(self, rng=None):
+			if rng is None:
+				rng = DEFAULT_RANDOM.local()
+			# Apply the '~' (choose sig) flag
+			plans = self.plans
+			plan = plans[0] if len(plans) == 1 else rng.choice(plans)
 			# Decide whether to use WordGenerator
-			if 'W' in sigs:
+			if plan.words:
 				if not self.worddict:
 					raise ValueError('Attempted to use the `W` signifier while no word dictionary is loaded, load a dictionary with the `-w` or `-l` command options')
 				if self.word_any_length:
-					wordpool = self.worddict.getWordPool()
+					out = self.worddict.sample_word(rng=rng)
 				else:
-					wordpool = self.worddict.getWordPool(self.length_lower, self.length_upper)
-				out = random.choice(tuple(wordpool))
+					out = self.worddict.sample_word(self.length_lower, self.length_upper, rng)
 			else:
 				# Choose length
-				length = random.randint(self.length_lower, self.length_upper)
-				# Collect pools
-				pool = {c for sig in sigs for c in Pattern.pools_dict[sig]}
+				length = rng.randint(self.length_lower, self.length_upper)
+				pool = plan.pool
 				# Apply the '=' (repeat same) flag
-				if REPEAT_EQ:
-					c = random.choice(tuple(pool))
-					if CAP_MODE == 1 or CAP_MODE == 2 or CAP_MODE == 3 and random.randrange(2):
-						CAP_MODE = 2
-					else:
-						CAP_MODE = 0
-					out = ''.join(repeat(c,length))
+				if plan.repeat:
+					return rng.choice(pool)*length
 				# Generate sequence normally
-				else:
-					out = ''
-					for _ in range(length):
-						c = random.choice(tuple(pool))
-						out += c
+				out = rng.string(pool, length)
 			# Apply the '+' and '^' (capitalization) flags
-			if CAP_MODE == 3:
-				def randcap(matchobj):
-					c = matchobj.group()
-					return c.upper() if random.randrange(2) else c
-				out = re.sub(r'[a-z]', randcap, out)
-			elif CAP_MODE == 2:
-				out = out.upper()
-			elif CAP_MODE == 1:
-				start, c = random.choice([(m.start(), m.group()) for m in re.finditer(r'[a-z]', out)])
-				out = out[0:start]+(c.upper())+out[start+1:]
+			if plan.cap_mode:
+				out = Pattern.Expression.capitalize(out, plan.cap_mode, rng)
 			# Return generated sequence
 			return out
 
-	def __init__(self, pattern, worddict=None):
+		def max_length(self):
+			# Longest output, the longest word in range for the `W` signifier
+			longest = 0
+			for plan in self.plans:
+				if plan.words:
+					if self.worddict:
+						counts = self.worddict.lengthCounts() if self.word_any_length else self.worddict.lengthCounts(self.length_lower, self.length_upper)
+						if counts:
+							longest = max(longest, counts[-1][0])
+				else:
+					longest = max(longest, self.length_upper)
+			return longest
+
+		def fixed_length(self):
+			# Whether every output has the same length
+			if self.word_any_length and any(plan.words for plan in self.plans):
+				return False
+			return self.length_lower == self.length_upper
+
+		def keyspace(self):
+			# Number of distinct outputs, exact
+			keyspace = sum(count for count, _ in self.outcomes())
+			chars = self.char_classes()
+			if not chars:
+				return keyspace
+			lower, upper = self.length_lower, self.length_upper
+			if lower == 0:
+				# The empty string, whichever plan is chosen
+				keyspace += 1
+				lower = 1
+			if lower > upper:
+				return keyspace
+			single_cap, _, subsets = chars
+			for _, terms in subsets:
+				for sign, special, other in terms:
+					if self.plans[0].repeat:
+						# Every length repeats one character
+						keyspace += sign * (upper-lower+1) * (special+other)
+					elif single_cap:
+						# `k` special characters give `max(k, 1)` outputs: summed over `k`, that is
+						# `L*a*(a+b)**(L-1) + b**L` outputs of length `L`
+						keyspace += sign * (special*arithmetic_geometric(special+other, lower, upper) + geometric(other, lower, upper))
+					else:
+						keyspace += sign * geometric(special+other, lower, upper)
+			return keyspace
+
+		def entropy(self):
+			# Shannon entropy of the output, in bits
+			entropy = sum(-log2p * 2**(math.log2(count)+log2p) for count, log2p in self.outcomes() if count)
+			chars = self.char_classes()
+			if not chars:
+				return entropy
+			single_cap, sizes, subsets = chars
+			plans = self.plans
+			log2w = -math.log2(len(plans))
+			log2l = -math.log2(self.length_upper-self.length_lower+1)
+			for length in range(self.length_lower, self.length_upper+1):
+				if length == 0:
+					log2p = math.log2(len(sizes)) + log2w + log2l
+					entropy -= log2p * 2**log2p
+					continue
+				if plans[0].repeat:
+					length = 1
+				for members, terms in subsets:
+					# Probability of each base string of length `L` that exactly the plans `members` can draw
+					log2s = logsumexp2([log2w + log2l - length*math.log2(sizes[i]) for i in members])
+					if single_cap:
+						# Each base string splits into `max(k, 1)` equally likely outputs, `k` its special characters
+						for sign, special, other in terms:
+							mass = sign * scaled(log2s, special+other, length)
+							if mass:
+								entropy += mass * (expected_log2(length, special/(special+other)) - log2s)
+					else:
+						# A base string with `k` special characters has probability `S*2**(L-k)`, summed over
+						# `k` in closed form: `(a+2b)**L` strings' worth of mass, less `L*2b*(a+2b)**(L-1)` bits
+						for sign, special, other in terms:
+							mass = sign * scaled(log2s, special+2*other, length)
+							bits = sign * 2*other*length * scaled(log2s, special+2*other, length-1)
+							entropy -= mass*log2s + bits
+			return entropy
+
+		def outcomes(self):
+			# `(count, log2p)` classes of the word outputs, computed once (expressions never change after compiling)
+			if self._outcomes is None:
+				log2w = -math.log2(len(self.plans))
+				self._outcomes = [outcome for plan in self.plans if plan.words for outcome in self.word_outcomes(plan, log2w)]
+			return self._outcomes
+
+		def char_classes(self):
+			"""`(single_cap, sizes, subsets)` for the character plans, or None if there are none.
+
+			Outputs are counted in closed form from the plans: per-character probabilities come
+			from the pools (where '+' and '+^' are already folded in), and the sets of plans able to
+			produce a string are counted by inclusion-exclusion. `subsets` holds `(members, terms)`
+			for every set of plans, with `(sign, special, other)` terms: a string of length `L` that
+			exactly `members` can draw, with `k` special characters, is counted by
+			`sum(sign * comb(L, k) * special**k * other**(L-k))` over the terms. Words are assumed
+			to be lowercase, and word outputs to never coincide with character outputs.
+			"""
+			if self._chars is None:
+				char_plans = [plan for plan in self.plans if not plan.words]
+				if not char_plans:
+					self._chars = ()
+					return None
+				# Characters grouped by (set of plans that can draw them, whether they are "special")
+				# Special characters are lowercase letters for '^', and otherwise characters with a
+				# pool multiplicity of 1, which only differs from the rest after '+^' doubling
+				single_cap = char_plans[0].cap_mode == 1
+				types = {}
+				for i, plan in enumerate(char_plans):
+					for c in set(plan.pool):
+						mask, special = types.get(c, (0, None))
+						if special is None:
+							special = c in Pattern.lowercase if single_cap else plan.pool.count(c) == 1
+						types[c] = (mask | 1 << i, special)
+				subsets = range(1, 1 << len(char_plans))
+				# Characters available to every plan in a subset: (special, other)
+				within = {}
+				for u in subsets:
+					special = sum(1 for mask, sp in types.values() if mask & u == u and sp)
+					other = sum(1 for mask, sp in types.values() if mask & u == u and not sp)
+					within[u] = (special, other)
+				classes = []
+				for t in subsets:
+					members = [i for i in range(len(char_plans)) if t >> i & 1]
+					terms = [((-1)**(bin(u).count('1')-len(members)),)+within[u] for u in subsets if u & t == t and any(within[u])]
+					if terms:
+						classes.append((members, terms))
+				self._chars = (single_cap, [len(plan.pool) for plan in char_plans], classes)
+			return self._chars or None
+
+		def word_outcomes(self, plan, log2w):
+			if not self.worddict:
+				raise ValueError('Attempted to use the `W` signifier while no word dictionary is loaded, load a dictionary with the `-w` or `-l` command options')
+			# Words are grouped by length and by probability, which differs between words of a `weighted` dictionary
+			if self.word_any_length:
+				classes = self.worddict.weightClasses()
+			else:
+				classes = self.worddict.weightClasses(self.length_lower, self.length_upper)
+			for length, count, p in classes:
+				if plan.cap_mode == 3:
+					outputs = 2**length
+				elif plan.cap_mode == 1:
+					outputs = max(length, 1)
+				else:
+					outputs = 1
+				yield (count*outputs, log2w + math.log2(p) - math.log2(outputs))
+
+		@staticmethod
+		def capitalize(out, cap_mode, rng):
+			if cap_mode == 3:
+				return ''.join([c.upper() if c in Pattern.lowercase and rng.randbelow(2) else c for c in out])
+			elif cap_mode == 2:
+				return out.upper()
+			elif cap_mode == 1:
+				positions = [i for i, c in enumerate(out) if c in Pattern.lowercase]
+				if positions:
+					i = rng.choice(positions)
+					out = out[:i]+out[i].upper()+out[i+1:]
+			return out
+
+	def __init__(self, pattern, worddict=None, rng=None, stats=None):
 		def compile_expression(match, worddict=None):
 			if match:
 				gdict = match.groupdict()
@@ -153,11 +341,187 @@ class Pattern:
 				raise ValueError('Pattern `{}` failed to compile at index: {}'.format(pattern, pos))
 			self.expressions.append(exp)
 			pos = match.end()
-		# Set word dictionary
+		# Set source string, word dictionary and randomness source
+		self.pattern = pattern
 		self.worddict = worddict
+		self.rng = rng if rng is not None else DEFAULT_RANDOM
+		# Optional instrumentation, see `stats.Stats`
+		self.stats = stats
 
 	def __str__(self):
 		return ''.join(str(exp) for exp in self.expressions)
 
+	def __reduce__(self):
+		# Pickled as its source, recompiled on load (without `stats`)
+		return (Pattern, (self.pattern, self.worddict, self.rng))
+
+	@staticmethod
+	def compile(pattern, worddict=None, rng=None):
+		# Compiled pattern from the shared `Pattern.cache`, only compiling it on a miss
+		return Pattern.cache.get(pattern, worddict, rng)
+
+	def max_length(self):
+		# Longest password the pattern can produce
+		return sum(e.max_length() for e in self.expressions)
+
+	def keyspace(self):
+		# Number of distinct passwords, counting each expression's outputs independently: only an
+		# upper bound unless `keyspace_is_exact`
+		keyspace = 1
+		for e in self.expressions:
+			keyspace *= e.keyspace()
+		return keyspace
+
+	def entropy(self):
+		# Entropy of a generated password in bits, treating expressions as independent: only an
+		# upper bound unless `keyspace_is_exact`
+		return sum(e.entropy() for e in self.expressions)
+
+	def keyspace_is_exact(self):
+		# Outputs of expressions of varying length can run together (`%d[1-2]%d[1-2]` makes `123`
+		# two ways), so their product over-counts. With at most one such expression, every
+		# password splits into its expressions' outputs only one way
+		return sum(1 for e in self.expressions if not e.fixed_length()) <= 1
+
+	def uses_words(self):
+		return any('W' in e.signifiers for e in self.expressions)
+
+	def _generate(self, rng):
+		return ''.join([e.generate(rng) for e in self.expressions])
+
 	def generate(self):
-		return ''.join(e.generate() for e in self.expressions)
\ No newline at end of file
+		if self.stats is not None:
+			return self.stats.generate(self)
+		return self._generate(self.rng.local())
+
+	def iter_generate(self):
+		# Endless stream of passwords
+		if self.stats is not None:
+			while True:
+				yield self.stats.generate(self)
+		expressions, rng = self.expressions, self.rng.local()
+		while True:
+			yield ''.join([e.generate(rng) for e in expressions])
+
+	def generate_many(self, n, vectorize=None):
+		# Stream of `n` passwords, vectorized with NumPy for large batches unless `vectorize` is False
+		if vectorize is None:
+			vectorize = n >= batch.MIN_BATCH and batch.available()
+		if vectorize:
+			for out in batch.generate(self, n):
+				yield out
+			return
+		if self.stats is not None:
+			for _ in range(n):
+				yield self.stats.generate(self)
+			return
+		expressions, rng = self.expressions, self.rng.local()
+		for _ in range(n):
+			yield ''.join([e.generate(rng) for e in expressions])
+
+
+def geometric(r, lower, upper):
+	# `sum(r**L for L in range(lower, upper+1))`, exactly
+	if r == 1:
+		return upper-lower+1
+	return (r**(upper+1) - r**lower) // (r-1)
+
+def arithmetic_geometric(r, lower, upper):
+	# `sum(L * r**(L-1) for L in range(lower, upper+1))`, exactly
+	if r == 1:
+		return (upper*(upper+1) - (lower-1)*lower) // 2
+	def prefix(n):
+		return (1 - (n+1)*r**n + n*r**(n+1)) // (1-r)**2
+	return prefix(upper) - prefix(lower-1)
+
+def scaled(log2s, r, e):
+	# `2**log2s * r**e` without overflow
+	if e == 0:
+		return 2**log2s
+	if r == 0:
+		return 0.0
+	return 2**(log2s + e*math.log2(r))
+
+def expected_log2(n, q):
+	# `E[log2(max(K, 1))]` for `K` binomial with `n` trials of probability `q`
+	if q == 0:
+		return 0.0
+	if q == 1:
+		return math.log2(n)
+	mean, var = n*q, n*q*(1-q)
+	if mean >= 100:
+		# Expansion of `log(K)` around the mean with the binomial's central moments, within 1e-5 bits
+		m3 = var*(1-2*q)
+		m4 = 3*var*var + var*(1-6*q*(1-q))
+		return (math.log(mean) - var/(2*mean**2) + m3/(3*mean**3) - m4/(4*mean**4)) / math.log(2)
+	# Sum over the terms within 12 standard deviations of the mean, the rest being negligible
+	spread = 12*math.sqrt(var) + 1
+	lognq, logq, log1q = math.lgamma(n+1), math.log(q), math.log1p(-q)
+	total = 0.0
+	for k in range(max(2, int(mean-spread)), min(n, int(mean+spread))+1):
+		total += math.exp(lognq - math.lgamma(k+1) - math.lgamma(n-k+1) + k*logq + (n-k)*log1q) * math.log2(k)
+	return total
+
+def logsumexp2(values):
+	# `log2(sum(2**v for v in values))` without underflow
+	top = max(values)
+	return top + math.log2(sum(2**(v-top) for v in values))
+
+
+class PatternCache:
+	"""Bounded LRU cache of compiled patterns.
+
+	Entries are keyed on the pattern string and the identity of the word dictionary and
+	randomness source. A cached pattern keeps both alive, so their ids cannot be reused while
+	the entry exists. Entries using a dictionary are dropped when its words file is replaced.
+	"""
+	def __init__(self, maxsize=128):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self._watching = set()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, pattern, worddict=None, rng=None):
+		key = (pattern, id(worddict), id(rng))
+		with self._lock:
+			compiled = self._entries.get(key)
+			if compiled is not None:
+				self._entries.move_to_end(key)
+				self.hits += 1
+				return compiled
+			self.misses += 1
+		compiled = Pattern(pattern, worddict, rng)
+		with self._lock:
+			if worddict is not None and type(worddict) not in self._watching:
+				self._watching.add(type(worddict))
+				type(worddict).onChange(self.invalidate)
+			self._entries[key] = compiled
+			while len(self._entries) > max(self.maxsize, 0):
+				self._entries.popitem(last=False)
+		return compiled
+
+	def resize(self, maxsize):
+		with self._lock:
+			self.maxsize = maxsize
+			while len(self._entries) > max(maxsize, 0):
+				self._entries.popitem(last=False)
+
+	def invalidate(self, words_file=None):
+		# Drop patterns using the dictionary at `words_file`, or every pattern
+		with self._lock:
+			for key, compiled in list(self._entries.items()):
+				if words_file is None or (compiled.worddict and compiled.worddict.words_file == words_file):
+					del self._entries[key]
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+Pattern.cache = PatternCache()
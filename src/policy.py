@@ -0,0 +1,266 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Composition policies ("at least 2 digits, no character more than twice"), generated by construction
+
+import math
+from bisect import bisect_right
+from math import comb
+
+from .generator import Generator
+from .pattern import Pattern
+
+# Largest number of (length, characters per class) splits drawn from a single table
+MAX_SPLITS = 1<<16
+
+class Policy(Generator):
+	"""Uniformly random passwords from a character pattern that satisfy composition rules.
+
+	`pattern` must be a single expression without the `W` signifier, the `=` or `~` flags, or `^`
+	unless with `+`, such as `%{dsw+^}[12-16]`. Its alphabet is every character it can produce, and its lengths are those
+	of its length specifier. Passwords need at least `min_digits`, `min_symbols`, `min_lower` and
+	`min_upper` characters of each class, and no character may appear more than `max_repeat`
+	times (None for no limit). Every password meeting the rules is equally likely, so lengths
+	are weighted by how many passwords they allow.
+
+	Valid passwords are counted exactly up front, which gives `keyspace` and the feasibility
+	check. Each password is then built directly: a length, the number of characters from each
+	class, the characters of each class, and a uniform shuffle, without ever rejecting a draw.
+	"""
+	classes = (
+		('digits', frozenset(Pattern.pools_dict['d'])),
+		('symbols', frozenset(Pattern.pools_dict['s'])),
+		('lower', Pattern.lowercase),
+		('upper', frozenset(c.upper() for c in Pattern.lowercase)),
+	)
+
+	def __init__(self, pattern, min_digits=0, min_symbols=0, min_lower=0, min_upper=0, max_repeat=None, rng=None):
+		if not isinstance(pattern, Pattern):
+			pattern = Pattern.compile(pattern, rng=rng)
+		if len(pattern.expressions) != 1:
+			raise ValueError('A policy pattern must be a single expression')
+		expression = pattern.expressions[0]
+		if any(plan.words or plan.repeat for plan in expression.plans):
+			raise ValueError('A policy pattern cannot use the `W` signifier or the `=` flag')
+		# The alphabet below stands for every character of every position, which `~` (one
+		# signifier per password) and `^` (exactly one capital) do not allow
+		if len(expression.plans) > 1 or expression.plans[0].cap_mode == 1:
+			raise ValueError('A policy pattern cannot use the `~` flag, or the `^` flag without `+`')
+		if max_repeat is not None and max_repeat < 1:
+			raise ValueError('`max_repeat` must be at least 1')
+		mins = (min_digits, min_symbols, min_lower, min_upper)
+		if any(m < 0 for m in mins):
+			raise ValueError('Minimum counts cannot be negative')
+		self.pattern = pattern
+		self.rng = rng if rng is not None else pattern.rng
+		self.mins = mins
+		self.max_repeat = max_repeat
+
+		# Alphabet of the expression, split into classes
+		alphabet = set()
+		for plan in expression.plans:
+			alphabet.update(plan.pool)
+			if plan.cap_mode:
+				alphabet.update(c.upper() for c in plan.pool)
+		self.pools = tuple(''.join(sorted(alphabet & chars)) for _, chars in Policy.classes)
+		self.lengths = range(expression.length_lower, expression.length_upper+1)
+		top = expression.length_upper
+
+		# `self.strings[c][m]`: strings of length `m` over class `c` within `max_repeat`, with the
+		# per-letter tables used to draw them (`_letters`)
+		self.letters = []
+		self.strings = []
+		for pool in self.pools:
+			if max_repeat is None:
+				self.letters.append(None)
+				self.strings.append([len(pool)**m for m in range(top+1)])
+			else:
+				tables = Policy.letter_tables(len(pool), top, max_repeat)
+				self.letters.append(tables)
+				self.strings.append(tables[-1][0])
+
+		# `self.mixes[c][m]`: cumulative weights of giving `j` (from `mins[c]`) of the first `m`
+		# characters to class `c`, the rest going to the classes before it; its total is the
+		# number of valid strings of length `m` over classes `0..c`
+		self.mixes = []
+		totals = [1] + [0]*top
+		for c, strings in enumerate(self.strings):
+			mix = []
+			for m in range(top+1):
+				cumulative, acc = [], 0
+				for j in range(mins[c], m+1):
+					acc += comb(m, j) * strings[j] * totals[m-j]
+					cumulative.append(acc)
+				mix.append(cumulative)
+			self.mixes.append(mix)
+			totals = [cumulative[-1] if cumulative else 0 for cumulative in mix]
+
+		# Cumulative counts over lengths
+		self.counts = [totals[n] for n in self.lengths]
+		# `factorials[n]` orders `n` characters, for the shuffle in `_generate`
+		self.factorials = [math.factorial(n) for n in range(top+1)]
+		self.cumulative = []
+		acc = 0
+		for count in self.counts:
+			acc += count
+			self.cumulative.append(acc)
+		if not acc:
+			raise ValueError('No password of pattern `{}` can satisfy the policy'.format(pattern))
+
+		# Every (length, characters per class) split with its cumulative weight, so `_generate`
+		# needs a single draw for both; too many splits are drawn a class at a time instead
+		slack = [n-sum(mins) for n in self.lengths if n >= sum(mins)]
+		if sum(comb(k+len(mins)-1, len(mins)-1) for k in slack) <= MAX_SPLITS:
+			self.splits, self.split_weights = [], []
+			acc = 0
+			for n in self.lengths:
+				for split, weight in self.iter_splits(n, len(mins)-1):
+					acc += weight
+					self.splits.append(split)
+					self.split_weights.append(acc)
+		else:
+			self.splits = self.split_weights = None
+
+	def iter_splits(self, m, c):
+		# `(split, weight)` for every way to give the first `m` characters to classes `0..c`
+		cumulative = self.mixes[c][m]
+		prev = 0
+		for i, acc in enumerate(cumulative):
+			j = self.mins[c]+i
+			if acc > prev:
+				if c == 0:
+					yield (j,), acc-prev
+				else:
+					# The weight factors as `comb(m, j) * strings[j]` times the weight of the rest
+					factor = comb(m, j) * self.strings[c][j]
+					for split, weight in self.iter_splits(m-j, c-1):
+						yield split + (j,), factor*weight
+			prev = acc
+
+	# Rule names accepted by `parse`, and the keyword argument each sets
+	rules = {'digits': 'min_digits', 'symbols': 'min_symbols', 'lower': 'min_lower', 'upper': 'min_upper', 'repeat': 'max_repeat'}
+
+	@staticmethod
+	def parse(spec):
+		# Keyword arguments from a spec such as `digits=2,symbols=1,upper=1,repeat=2`
+		kwargs = {}
+		for rule in spec.split(','):
+			name, _, value = rule.partition('=')
+			name = name.strip().lower()
+			if name not in Policy.rules or not value.strip().isdigit():
+				raise ValueError('Invalid policy rule `{}`, rules are `name=number` with names: {}'.format(rule.strip(), ', '.join(Policy.rules)))
+			kwargs[Policy.rules[name]] = int(value)
+		return kwargs
+
+	@staticmethod
+	def letter_tables(k, top, max_repeat):
+		# `tables[t] = (counts, cumulative)`: `counts[m]` strings of length `m` over the first `t`
+		# letters, none used more than `max_repeat` times; `cumulative[m]` the running weights of
+		# letter `t` being used `j` times in them
+		tables = [([1] + [0]*top, None)]
+		for _ in range(k):
+			prev = tables[-1][0]
+			counts, cumulative = [], []
+			for m in range(top+1):
+				weights, acc = [], 0
+				for j in range(min(max_repeat, m)+1):
+					acc += comb(m, j) * prev[m-j]
+					weights.append(acc)
+				counts.append(acc)
+				cumulative.append(weights)
+			tables.append((counts, cumulative))
+		return tables
+
+	def __reduce__(self):
+		# Pickled as its pattern and rules, the tables rebuilt on load
+		return (Policy, (self.pattern,)+self.mins+(self.max_repeat, self.rng))
+
+	def __str__(self):
+		rules = ['%s>=%d' % (name, m) for (name, _), m in zip(Policy.classes, self.mins) if m]
+		if self.max_repeat is not None:
+			rules.append('repeat<=%d' % self.max_repeat)
+		return '%s with %s' % (self.pattern, ', '.join(rules) or 'no rules')
+
+	def keyspace(self):
+		return self.cumulative[-1]
+
+	def entropy(self):
+		# Passwords are uniform over the keyspace
+		return math.log2(self.keyspace())
+
+	def uses_words(self):
+		return False
+
+	def _generate(self, rng):
+		randbelow = rng.randbelow
+		if self.splits is not None:
+			split = self.splits[bisect_right(self.split_weights, randbelow(self.split_weights[-1]))]
+			n = sum(split)
+		else:
+			# Length, weighted by the number of valid passwords of each length, then the
+			# characters per class, last class first
+			n = m = self.lengths[bisect_right(self.cumulative, randbelow(self.cumulative[-1]))]
+			split = [0]*len(self.pools)
+			for c in range(len(self.pools)-1, -1, -1):
+				cumulative = self.mixes[c][m]
+				split[c] = j = self.mins[c] + bisect_right(cumulative, randbelow(cumulative[-1]))
+				m -= j
+		chars = []
+		for c, j in enumerate(split):
+			if j:
+				if self.letters[c] is None:
+					chars.append(rng.string(self.pools[c], j))
+				else:
+					chars.append(self._letters(c, j, randbelow))
+		# Uniform placement of the drawn characters: a Fisher-Yates shuffle, with every swap
+		# taken from the digits of one draw below `n!`
+		out = list(''.join(chars))
+		r = randbelow(self.factorials[n])
+		for i in range(n-1, 0, -1):
+			r, k = divmod(r, i+1)
+			out[i], out[k] = out[k], out[i]
+		return ''.join(out)
+
+	def _letters(self, c, m, randbelow):
+		# The letters of `m` characters of class `c`, each used at most `max_repeat` times. One
+		# draw below the number of such strings is split into the count of each letter in turn
+		pool, tables = self.pools[c], self.letters[c]
+		out = []
+		r = randbelow(tables[len(pool)][0][m])
+		for t in range(len(pool), 0, -1):
+			if not m:
+				break
+			cumulative = tables[t][1][m]
+			j = bisect_right(cumulative, r)
+			# What is left of `r` is uniform below `comb(m, j)*counts[m-j]`, and the second
+			# factor is the range for the letters before this one
+			rest = tables[t-1][0][m-j]
+			r = (r - (cumulative[j-1] if j else 0)) % rest
+			if j:
+				out.append(pool[t-1]*j)
+				m -= j
+		return ''.join(out)
+
+	def generate(self):
+		return self._generate(self.rng.local())
+
+	def iter_generate(self):
+		rng = self.rng.local()
+		while True:
+			yield self._generate(rng)
+
+	def generate_many(self, n, vectorize=None):
+		rng = self.rng.local()
+		for _ in range(n):
+			yield self._generate(rng)
@@ -0,0 +1,97 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from collections import deque
+
+class Prefetcher:
+	"""Keeps up to `size` passwords of a pattern ready, generated by a background thread.
+
+	`get` returns a ready password at once, or generates one in the calling thread if the
+	buffer has run dry. `set_pattern` drops every buffered password and starts filling the
+	buffer for the new pattern. Any object with a `generate` method can be used as the pattern
+	(a `Pattern` or a `policy.Policy`). Use it as a context manager, or call `close` when done.
+	"""
+	def __init__(self, pattern, size=64):
+		if size < 1:
+			raise ValueError('`size` must be at least 1')
+		self.size = size
+		self.hits = 0
+		self.misses = 0
+		self._pattern = pattern
+		# Bumped whenever the pattern changes, so passwords of an older pattern are never buffered
+		self._epoch = 0
+		self._failed = -1
+		self._buffer = deque()
+		self._cond = threading.Condition()
+		self._running = True
+		self._thread = threading.Thread(target=self._produce, name='passwordgen-prefetch', daemon=True)
+		self._thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __len__(self):
+		return len(self._buffer)
+
+	@property
+	def pattern(self):
+		return self._pattern
+
+	def _produce(self):
+		cond = self._cond
+		while True:
+			with cond:
+				while self._running and (len(self._buffer) >= self.size or self._failed == self._epoch):
+					cond.wait()
+				if not self._running:
+					return
+				pattern, epoch = self._pattern, self._epoch
+			try:
+				out = pattern.generate()
+			except Exception:
+				# Left for `get` to raise in the caller's thread; wait for the next pattern
+				with cond:
+					self._failed = epoch
+				continue
+			with cond:
+				if epoch == self._epoch:
+					self._buffer.append(out)
+
+	def get(self):
+		with self._cond:
+			if self._buffer:
+				self.hits += 1
+				self._cond.notify()
+				return self._buffer.popleft()
+			self.misses += 1
+			pattern = self._pattern
+		return pattern.generate()
+
+	def set_pattern(self, pattern):
+		with self._cond:
+			self._pattern = pattern
+			self._epoch += 1
+			self._buffer.clear()
+			self._cond.notify()
+
+	def close(self):
+		with self._cond:
+			self._running = False
+			self._buffer.clear()
+			self._cond.notify()
+		self._thread.join()
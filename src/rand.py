@@ -0,0 +1,253 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import struct
+import threading
+import weakref
+
+class RandomSource:
+	"""Base for the randomness used by `Pattern`.
+
+	Subclasses only provide raw bytes through `_entropy`. Bytes are buffered in large
+	blocks, and turned into indexes by rejection sampling so every index is equally likely.
+	"""
+	block_size = 4096
+	# Translation tables for `string`, keyed by pool
+	_tables = {}
+
+	def __init__(self, block_size=None):
+		if block_size:
+			self.block_size = block_size
+		self._buf = b''
+		self._pos = 0
+		# Total bytes taken from `_entropy` and words sampled with this source, for `Stats`
+		self.bytes_drawn = 0
+		self.words_drawn = 0
+
+	def _entropy(self, n):
+		raise NotImplementedError
+
+	def spawn(self):
+		# Independent source of the same kind, for use in another process or thread
+		raise NotImplementedError
+
+	def local(self):
+		# The source to draw from in the calling thread (see `ThreadLocalRandom`)
+		return self
+
+	def randbytes(self, n):
+		pos = self._pos
+		if pos+n > len(self._buf):
+			self._buf = self._buf[pos:] + self._entropy(max(self.block_size, n))
+			self.bytes_drawn += max(self.block_size, n)
+			pos = 0
+		self._pos = pos+n
+		return self._buf[pos:pos+n]
+
+	def randbelow(self, n):
+		if n <= 0:
+			raise ValueError('Cannot draw from an empty range')
+		if n <= 256:
+			limit = 256 - 256%n
+			while True:
+				if self._pos >= len(self._buf):
+					self._buf = self._entropy(self.block_size)
+					self.bytes_drawn += self.block_size
+					self._pos = 0
+				b = self._buf[self._pos]
+				self._pos += 1
+				if b < limit:
+					return b%n
+		nbytes = ((n-1).bit_length()+7)//8
+		span = 1 << (8*nbytes)
+		limit = span - span%n
+		while True:
+			v = int.from_bytes(self.randbytes(nbytes), 'little')
+			if v < limit:
+				return v%n
+
+	def randrange(self, start, stop=None):
+		if stop is None:
+			return self.randbelow(start)
+		return start + self.randbelow(stop-start)
+
+	def randint(self, a, b):
+		return a + self.randbelow(b-a+1)
+
+	def choice(self, seq):
+		return seq[self.randbelow(len(seq))]
+
+	def string(self, pool, length):
+		# Draw `length` characters from `pool`, a whole block at a time when the pool is small ASCII
+		if length <= 0:
+			return ''
+		table = RandomSource._tables.get(pool)
+		if table is None:
+			table = RandomSource._table(pool)
+		if not table:
+			return ''.join([pool[self.randbelow(len(pool))] for _ in range(length)])
+		table, delete, limit = table
+		out = ''
+		while len(out) < length:
+			need = length-len(out)
+			chunk = self.randbytes(need*256//limit + 8)
+			out += chunk.translate(table, delete).decode('ascii')
+		return out[:length]
+
+	@staticmethod
+	def _table(pool):
+		# Map every accepted byte straight to its pool character, and delete rejected bytes
+		n = len(pool)
+		if not 0 < n <= 256 or any(ord(c) > 127 for c in pool):
+			table = ()
+		else:
+			limit = 256 - 256%n
+			table = (bytes(ord(pool[b%n]) if b < limit else 0 for b in range(256)), bytes(range(limit, 256)), limit)
+		RandomSource._tables[pool] = table
+		return table
+
+
+class SecureRandom(RandomSource):
+	"""Cryptographically secure randomness from `os.urandom` (the default)."""
+
+	def __init__(self, block_size=None):
+		RandomSource.__init__(self, block_size)
+		_secure_sources.add(self)
+
+	def _entropy(self, n):
+		return os.urandom(n)
+
+	def spawn(self):
+		return SecureRandom(self.block_size)
+
+
+class FastRandom(RandomSource):
+	"""Mersenne Twister randomness, optionally seeded. Not suitable for real passwords."""
+
+	def __init__(self, seed=None, block_size=None):
+		import random
+		RandomSource.__init__(self, block_size)
+		self._random = random.Random(seed)
+
+	def _entropy(self, n):
+		return self._random.getrandbits(8*n).to_bytes(n, 'little')
+
+	def spawn(self):
+		return FastRandom(int.from_bytes(os.urandom(16), 'little'), self.block_size)
+
+
+class CounterRandom(RandomSource):
+	"""Reproducible randomness for fixtures and load tests. NEVER use it for real credentials.
+
+	Anyone who knows the seed can regenerate every password. Every password index gets its own
+	stream, the keyed BLAKE2b hash of `(index, block)` for blocks 0, 1, ... So password #N can be
+	drawn directly after `seek(N)`, without generating the passwords before it.
+	"""
+	block_size = 64
+	counter = struct.Struct('<QQ')
+
+	def __init__(self, seed, index=0, block_size=None):
+		RandomSource.__init__(self, block_size)
+		self.seed = seed
+		self._key = CounterRandom.key(seed)
+		self.seek(index)
+
+	@staticmethod
+	def key(seed):
+		# Seeds can be ints, strings or bytes; `1` and `'1'` are the same seed
+		if isinstance(seed, int):
+			seed = str(seed)
+		if isinstance(seed, str):
+			seed = seed.encode('utf-8')
+		return hashlib.blake2b(seed, digest_size=32, person=b'passwordgen-seed').digest()
+
+	def seek(self, index):
+		# Start drawing from the stream of password `index`
+		self.index = index
+		self._block = 0
+		self._buf = b''
+		self._pos = 0
+
+	def _entropy(self, n):
+		out = []
+		for _ in range(-(-n // 64)):
+			out.append(hashlib.blake2b(CounterRandom.counter.pack(self.index, self._block), key=self._key).digest())
+			self._block += 1
+		return b''.join(out)[:n]
+
+	def spawn(self):
+		# Same seed: which passwords a worker draws is set with `seek`, not by its source
+		return CounterRandom(self.seed, self.index, self.block_size)
+
+
+class ThreadLocalRandom(RandomSource):
+	"""A separate source per thread, each spawned from `source` on first use in that thread.
+
+	Sources are not safe to share between threads, since their buffers are consumed in place.
+	This one can be: callers resolve the calling thread's source once with `local()` and draw
+	from that, so generating never touches state another thread can see.
+	"""
+
+	def __init__(self, source):
+		self.source = source
+		self._local = threading.local()
+
+	def __reduce__(self):
+		return (ThreadLocalRandom, (self.source,))
+
+	def local(self):
+		try:
+			return self._local.source
+		except AttributeError:
+			source = self._local.source = self.source.spawn()
+			return source
+
+	def spawn(self):
+		return ThreadLocalRandom(self.source.spawn())
+
+	def _entropy(self, n):
+		return self.local()._entropy(n)
+
+	def randbytes(self, n):
+		return self.local().randbytes(n)
+
+	def randbelow(self, n):
+		return self.local().randbelow(n)
+
+	def string(self, pool, length):
+		return self.local().string(pool, length)
+
+	@property
+	def bytes_drawn(self):
+		return self.local().bytes_drawn
+
+	@property
+	def words_drawn(self):
+		return self.local().words_drawn
+
+
+# Forked children must never reuse the bytes their parent had already buffered
+_secure_sources = weakref.WeakSet()
+
+def _after_fork():
+	for source in list(_secure_sources):
+		source._buf = b''
+		source._pos = 0
+
+if hasattr(os, 'register_at_fork'):
+	os.register_at_fork(after_in_child=_after_fork)
+
+DEFAULT_RANDOM = ThreadLocalRandom(SecureRandom())
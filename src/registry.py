@@ -0,0 +1,106 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+from collections import OrderedDict
+
+from .worddict import WordDictionary
+
+class DictionaryRegistry:
+	"""Named word dictionaries, loaded on first use and kept in memory up to a limit.
+
+	Names are either registered with `register` or taken from the formatted `*.txt` files in
+	`defaults_dir` (so `english` is `defaults_dir/english.txt`). Loaded dictionaries are kept
+	in least-recently-used order, and the oldest are dropped once there are more than
+	`max_entries` of them or their compiled indexes add up to more than `max_bytes`. None of
+	this touches the installed `words.txt`.
+	"""
+	def __init__(self, defaults_dir=None, max_entries=8, max_bytes=None):
+		self.defaults_dir = defaults_dir
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self._paths = {}
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		WordDictionary.onChange(self.invalidate)
+
+	def __contains__(self, name):
+		return self.path(name) is not None
+
+	def __len__(self):
+		return len(self._entries)
+
+	def register(self, name, words_file):
+		# `words_file` must already be formatted, see `WordDictionary.formatFile`
+		with self._lock:
+			self._paths[name] = words_file
+			self._entries.pop(name, None)
+
+	def names(self):
+		names = set(self._paths)
+		if self.defaults_dir and os.path.isdir(self.defaults_dir):
+			names.update(f[:-4] for f in os.listdir(self.defaults_dir) if f.endswith('.txt'))
+		return sorted(names)
+
+	def path(self, name):
+		if name in self._paths:
+			return self._paths[name]
+		if self.defaults_dir and os.sep not in name and (not os.altsep or os.altsep not in name):
+			words_file = os.path.join(self.defaults_dir, name.lower()+'.txt')
+			if os.path.isfile(words_file):
+				return words_file
+		return None
+
+	def get(self, name):
+		# The loaded dictionary called `name`, raising KeyError for unknown names
+		with self._lock:
+			worddict = self._entries.get(name)
+			if worddict is not None:
+				self._entries.move_to_end(name)
+				self.hits += 1
+				return worddict
+			self.misses += 1
+		words_file = self.path(name)
+		if words_file is None:
+			raise KeyError('No dictionary named `{}`, choose from: {}'.format(name, ', '.join(self.names()) or '-'))
+		worddict = WordDictionary(words_file)
+		with self._lock:
+			self._entries[name] = worddict
+			self._evict()
+		return worddict
+
+	def nbytes(self):
+		return sum(worddict.index.nbytes() for worddict in self._entries.values())
+
+	def resize(self, max_entries=None, max_bytes=None):
+		with self._lock:
+			self.max_entries = max_entries
+			self.max_bytes = max_bytes
+			self._evict()
+
+	def _evict(self):
+		# Always keeps the most recently used dictionary, even if it alone is over `max_bytes`
+		while len(self._entries) > 1 and ((self.max_entries is not None and len(self._entries) > self.max_entries)
+											or (self.max_bytes is not None and self.nbytes() > self.max_bytes)):
+			self._entries.popitem(last=False)
+
+	def invalidate(self, words_file=None):
+		# Drop dictionaries loaded from `words_file`, or every dictionary
+		with self._lock:
+			for name, worddict in list(self._entries.items()):
+				if words_file is None or os.path.abspath(worddict.words_file) == os.path.abspath(words_file):
+					del self._entries[name]
@@ -0,0 +1,240 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Long-running generation server (`passwordgen serve`) and its load-test client (`passwordgen loadtest`)
+#
+# The protocol is one JSON object per line in each direction. A request looks like
+#   {"id": 1, "pattern": "%d[4]%W", "count": 10, "unique": false, "dictionary": "english"}
+# where every key is optional, and the response is either
+#   {"id": 1, "passwords": [...]}    or    {"id": 1, "error": "..."}
+# Requests on one connection are answered in order.
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .pattern import Pattern
+from .utils import *
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Longest request line accepted, in bytes
+MAX_LINE = 1<<16
+# Default limit on the characters of all passwords of one request
+MAX_OUTPUT = 1<<24
+# Default limit on the longest password of a request's pattern, which also bounds the work of its keyspace
+MAX_LENGTH = 4096
+
+
+class Server:
+	def __init__(self, worddict=None, default_pattern=None, concurrency=4, max_pending=64, max_count=100000, registry=None, max_output=MAX_OUTPUT, max_length=MAX_LENGTH):
+		self.worddict = worddict
+		# Named dictionaries requests can pick instead of `worddict`, see `registry.DictionaryRegistry`
+		self.registry = registry
+		self.default_pattern = default_pattern
+		self.max_count = max_count
+		self.max_output = max_output
+		self.max_length = max_length
+		self.max_pending = max_pending
+		self.pending = 0
+		self._slots = asyncio.Semaphore(concurrency)
+		self._executor = ThreadPoolExecutor(concurrency)
+
+	def generate(self, pattern, count, unique, dictionary=None):
+		# Runs in an executor thread; compiled patterns are shared, each thread drawing from its own randomness
+		worddict = self.worddict
+		if dictionary is not None:
+			if self.registry is None:
+				raise ValueError('This server does not offer named dictionaries')
+			try:
+				worddict = self.registry.get(dictionary)
+			except KeyError as e:
+				raise ValueError(e.args[0])
+		compiled = Pattern.compile(pattern, worddict)
+		# Refuse requests that could produce too much output, or whose keyspace (for `unique`)
+		# would take too long to work out, before generating anything
+		length = compiled.max_length()
+		if length > self.max_length:
+			raise ValueError('Passwords of up to {} characters exceed the limit of {} characters'.format(length, self.max_length))
+		if count*length > self.max_output:
+			raise ValueError('{} passwords of up to {} characters exceed the limit of {} characters per request'.format(count, length, self.max_output))
+		if unique:
+			return list(compiled.generate_unique(count))
+		return list(compiled.generate_many(count))
+
+	async def handle(self, request):
+		try:
+			pattern = request.get('pattern') or self.default_pattern
+			count = int(request.get('count', 1))
+			if not pattern:
+				raise ValueError('No pattern given')
+			if not 0 <= count <= self.max_count:
+				raise ValueError('`count` must be between 0 and {}'.format(self.max_count))
+			# Backpressure: refuse work instead of queueing without bound
+			if self.pending >= self.max_pending:
+				raise ValueError('Server is busy, try again later')
+			self.pending += 1
+			try:
+				async with self._slots:
+					loop = asyncio.get_running_loop()
+					passwords = await loop.run_in_executor(self._executor, self.generate, pattern, count, bool(request.get('unique')), request.get('dictionary'))
+			finally:
+				self.pending -= 1
+			return {'id': request.get('id'), 'passwords': passwords}
+		except (ValueError, TypeError) as e:
+			return {'id': request.get('id'), 'error': str(e)}
+		except Exception as e:
+			# Anything else still gets an answer, and the connection stays open
+			return {'id': request.get('id'), 'error': 'Internal error: {}'.format(type(e).__name__)}
+
+	async def connection(self, reader, writer):
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				try:
+					request = json.loads(line)
+					if not isinstance(request, dict):
+						raise ValueError('Request must be a JSON object')
+				except ValueError as e:
+					response = {'id': None, 'error': 'Invalid request: {}'.format(e)}
+				else:
+					response = await self.handle(request)
+				writer.write(json.dumps(response).encode('utf-8') + b'\n')
+				# Do not read the next request until the client has taken this response
+				await writer.drain()
+		except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+			pass
+		finally:
+			writer.close()
+
+	async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+		if socket_path:
+			return await asyncio.start_unix_server(self.connection, socket_path, limit=MAX_LINE)
+		return await asyncio.start_server(self.connection, host, port, limit=MAX_LINE)
+
+
+class Client:
+	"""Minimal asyncio client for `Server`, one request at a time per connection."""
+	def __init__(self, reader, writer):
+		self.reader = reader
+		self.writer = writer
+		self._id = 0
+
+	@staticmethod
+	async def connect(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+		if socket_path:
+			reader, writer = await asyncio.open_unix_connection(socket_path, limit=1<<26)
+		else:
+			reader, writer = await asyncio.open_connection(host, port, limit=1<<26)
+		return Client(reader, writer)
+
+	async def generate(self, pattern=None, count=1, unique=False, dictionary=None):
+		self._id += 1
+		request = {'id': self._id, 'count': count, 'unique': unique}
+		if pattern:
+			request['pattern'] = pattern
+		if dictionary:
+			request['dictionary'] = dictionary
+		self.writer.write(json.dumps(request).encode('utf-8') + b'\n')
+		await self.writer.drain()
+		response = json.loads(await self.reader.readline())
+		if 'error' in response:
+			raise ValueError(response['error'])
+		return response['passwords']
+
+	def close(self):
+		self.writer.close()
+
+
+async def loadtest(pattern=None, count=1, requests=1000, connections=8, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, dictionary=None):
+	# Send `requests` requests over `connections` concurrent connections, returning latencies and total time
+	latencies = []
+	errors = [0]
+	remaining = [requests]
+	async def worker():
+		client = await Client.connect(host, port, socket_path)
+		try:
+			while remaining[0] > 0:
+				remaining[0] -= 1
+				start = time.perf_counter()
+				try:
+					await client.generate(pattern, count, dictionary=dictionary)
+				except ValueError:
+					errors[0] += 1
+				latencies.append(time.perf_counter()-start)
+		finally:
+			client.close()
+	start = time.perf_counter()
+	await asyncio.gather(*[worker() for _ in range(connections)])
+	return latencies, errors[0], time.perf_counter()-start
+
+def percentile(values, fraction):
+	values = sorted(values)
+	return values[min(len(values)-1, int(fraction*len(values)))] if values else 0
+
+
+def main(argv):
+	command, argv = argv[0], argv[1:]
+	parser = argparse.ArgumentParser(prog='passwordgen '+command)
+	parser.add_argument('-s', '--socket', help='Unix socket path to use instead of TCP')
+	parser.add_argument('--host', default=DEFAULT_HOST, help='Host to listen on or connect to (defaults to %(default)s)')
+	parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='TCP port (defaults to %(default)s)')
+	if command == 'serve':
+		parser.add_argument('pattern', nargs='?', default=None, help='Pattern used for requests that do not include one')
+		parser.add_argument('-c', '--concurrency', type=int, default=4, help='Requests generated at the same time (defaults to %(default)s)')
+		parser.add_argument('--max-pending', type=int, default=64, help='Requests accepted before the server answers "busy" (defaults to %(default)s)')
+		parser.add_argument('--max-count', type=int, default=100000, help='Largest `count` accepted in one request (defaults to %(default)s)')
+		parser.add_argument('--max-length', type=int, default=MAX_LENGTH, help='Longest password the pattern of a request may produce (defaults to %(default)s)')
+		parser.add_argument('--max-output', type=int, default=MAX_OUTPUT, help='Most characters one request may produce, `count` times the longest password of the pattern (defaults to %(default)s)')
+		parser.add_argument('--max-dictionaries', type=int, default=8, help='Named dictionaries kept loaded at once (defaults to %(default)s)')
+		parser.add_argument('--max-dictionary-mb', type=float, default=None, help='Memory limit for loaded named dictionaries, in MB')
+	else:
+		parser.add_argument('pattern', nargs='?', default=None, help='Pattern to request (defaults to the server\'s pattern)')
+		parser.add_argument('-n', '--count', type=int, default=1, help='Passwords per request (defaults to %(default)s)')
+		parser.add_argument('-r', '--requests', type=int, default=1000, help='Total requests to send (defaults to %(default)s)')
+		parser.add_argument('-c', '--connections', type=int, default=8, help='Concurrent connections (defaults to %(default)s)')
+		parser.add_argument('-d', '--dictionary', default=None, help='Named dictionary to request (defaults to the server\'s words file)')
+	args = parser.parse_args(argv)
+
+	if command == 'loadtest':
+		try:
+			latencies, errors, elapsed = asyncio.run(loadtest(args.pattern, args.count, args.requests, args.connections, args.host, args.port, args.socket, args.dictionary))
+		except OSError as e:
+			printerr('Could not connect to the server: %s' % e)
+			return 1
+		print('  %d requests (%d errors) in %.3fs: %.1f requests/s, %.1f passwords/s' % (len(latencies), errors, elapsed, len(latencies)/elapsed, len(latencies)*args.count/elapsed))
+		print('  Latency p50 %.3fms, p90 %.3fms, p99 %.3fms, max %.3fms' % tuple(1000*percentile(latencies, f) for f in (0.5, 0.9, 0.99, 1.0)))
+		return 0
+
+	# Load the word dictionary once, up front, and keep it warm
+	from .__main__ import DEFAULT_PATTERN, DEFAULT_WORDS_FILES_DIR, loadWordDictionary
+	from .registry import DictionaryRegistry
+	worddict = loadWordDictionary()
+	max_bytes = int(args.max_dictionary_mb*(1<<20)) if args.max_dictionary_mb else None
+	registry = DictionaryRegistry(DEFAULT_WORDS_FILES_DIR, args.max_dictionaries, max_bytes)
+	async def serve():
+		server = Server(worddict, args.pattern or DEFAULT_PATTERN, args.concurrency, args.max_pending, args.max_count, registry, args.max_output, args.max_length)
+		listener = await server.start(args.host, args.port, args.socket)
+		print('  Serving on %s' % (args.socket or '%s:%d' % (args.host, args.port)))
+		async with listener:
+			await listener.serve_forever()
+	try:
+		asyncio.run(serve())
+	except KeyboardInterrupt:
+		printerr('--INTERRUPTED--')
+	return 0
@@ -0,0 +1,111 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Duplicate-free batch generation, used by `Pattern.generate_unique`
+
+from array import array
+
+# Batches up to this size are deduplicated with an exact set of passwords
+EXACT_LIMIT = 1<<20
+# Passwords requested from the generator per round
+CHUNK_SIZE = 1<<16
+# Consecutive duplicates tolerated before giving up (the keyspace check can overestimate)
+MAX_MISSES = 1<<20
+
+class ExactSet:
+	def __init__(self):
+		self._items = set()
+
+	def __len__(self):
+		return len(self._items)
+
+	def insert(self, item):
+		# True if `item` was not seen before
+		if item in self._items:
+			return False
+		self._items.add(item)
+		return True
+
+
+class FingerprintSet:
+	"""Open-addressing set of 64-bit string hashes, 16 bytes per entry of `capacity`.
+
+	The table has exactly two 8-byte slots per entry, so it is never more than half full.
+	Two different passwords with the same fingerprint make the second one look like a
+	duplicate. That only costs a redraw: a real duplicate is never let through.
+	"""
+	def __init__(self, capacity):
+		# Slots are found with `%` rather than a power-of-two mask, which would round the table up to twice the size
+		self._size = max(2, 2*capacity)
+		self._slots = array('q', bytes(8*self._size))
+		self._len = 0
+
+	def __len__(self):
+		return self._len
+
+	def insert(self, item):
+		fingerprint = hash(item) or 1
+		slots, size = self._slots, self._size
+		i = fingerprint % size
+		while True:
+			slot = slots[i]
+			if slot == 0:
+				if 2*(self._len+1) > len(slots):
+					raise OverflowError('FingerprintSet is full')
+				slots[i] = fingerprint
+				self._len += 1
+				return True
+			if slot == fingerprint:
+				return False
+			i += 1
+			if i == size:
+				i = 0
+
+
+def generate(source, n, keyspace, exact_limit=EXACT_LIMIT, upper_bound=False):
+	"""Yield `n` distinct passwords from `source`.
+
+	`source` is either a function where `source(k)` returns an iterable of `k` passwords, or an
+	endless iterator of passwords (which is closed once enough have been taken from it).
+	Fails before generating anything if `keyspace` is smaller than `n`. If `keyspace` is only
+	an `upper_bound`, there may still be too few distinct passwords, so the whole batch is
+	generated (and held in memory) before the first one is yielded: a shortfall then fails
+	before any output, instead of after part of the batch.
+	"""
+	if n > keyspace:
+		raise ValueError('The pattern can only produce {} distinct passwords, fewer than the {} requested'.format(keyspace, n))
+	passwords = _generate(source, n, ExactSet() if n <= exact_limit else FingerprintSet(n))
+	if upper_bound:
+		return iter(list(passwords))
+	return passwords
+
+def _generate(source, n, seen):
+	produced = 0
+	misses = 0
+	try:
+		while produced < n:
+			for out in (source(min(n-produced, CHUNK_SIZE)) if callable(source) else source):
+				if seen.insert(out):
+					yield out
+					produced += 1
+					misses = 0
+					if produced == n:
+						break
+				else:
+					misses += 1
+					if misses > MAX_MISSES:
+						raise ValueError('Could not find {} distinct passwords, only found {}'.format(n, produced))
+	finally:
+		if not callable(source) and hasattr(source, 'close'):
+			source.close()
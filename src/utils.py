@@ -12,15 +12,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from __future__ import print_function
 import sys
-
-# Alias FileNotFoundError for python 2
-try: 
-	FileNotFoundError
-except NameError:
-	FileNotFoundError = IOError	
+import time
+from contextlib import contextmanager
 
 # Alias/shortcut for error printing
 def printerr(*args, **kwargs):
-	print(*args, file=sys.stderr, **kwargs)
\ No newline at end of file
+	print(*args, file=sys.stderr, **kwargs)
+
+# Wall-clock time spent in each startup/generation phase, for `--timings`
+class Timings:
+	def __init__(self, start=None):
+		self.phases = [('imports', time.time()-start)] if start else []
+
+	def add(self, phase, seconds):
+		for i, (name, total) in enumerate(self.phases):
+			if name == phase:
+				self.phases[i] = (name, total+seconds)
+				return
+		self.phases.append((phase, seconds))
+
+	@staticmethod
+	@contextmanager
+	def measure(timings, phase):
+		# No-op when `timings` is None
+		if timings is None:
+			yield
+			return
+		start = time.time()
+		try:
+			yield
+		finally:
+			timings.add(phase, time.time()-start)
+
+	def report(self):
+		printerr('  Timings: ' + ', '.join('%s %.1fms' % (name, 1000*total) for name, total in self.phases))
@@ -12,11 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import math
+import mmap
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import zip_longest
 import os
 import re
-from shutil import copyfileobj
+import struct
+import sys
+import time
+import types
+import weakref
+from array import array
+from shutil import copy2
 from tempfile import TemporaryFile, mkstemp
 
+from . import ingest
+from .rand import DEFAULT_RANDOM
 from .utils import *
 
 class WordDictionary:
@@ -52,27 +66,614 @@ class WordDictionary:
 					return i
 			return 0
 
+	class WordIndex:
+		"""Read-only word storage compiled from a formatted words file.
 
-	def __init__(self, words_file, wordmap=None):
+		The compiled file is a single blob of words plus offset arrays, so it can be
+		memory-mapped and queried without building any Python objects up front.
+		All integers are little-endian, and the layout is:
+
+		    header      magic, source size, source mtime, length count `L`, word count `N`
+		    starts      `L+1` uint32 values, the index of the first word of each length
+		    offsets     `N+1` uint32 values, the byte offset of each word into the blob
+		    blob        utf-8 encoded words, grouped by length and sorted within each length
+		"""
+		magic = b'PWGDIDX1'
+		header = struct.Struct('<8sQqII')
+
+		def __init__(self, buf):
+			if len(buf) < WordDictionary.WordIndex.header.size:
+				raise ValueError('Compiled words index is truncated')
+			magic, self.source_size, self.source_mtime, nlengths, nwords = WordDictionary.WordIndex.header.unpack_from(buf, 0)
+			if magic != WordDictionary.WordIndex.magic:
+				raise ValueError('Not a compiled words index')
+			pos = WordDictionary.WordIndex.header.size
+			self.starts = WordDictionary.WordIndex._uint32s(buf, pos, nlengths+1)
+			pos += 4*(nlengths+1)
+			self.offsets = WordDictionary.WordIndex._uint32s(buf, pos, nwords+1)
+			pos += 4*(nwords+1)
+			if len(buf) != pos+self.offsets[nwords]:
+				raise ValueError('Compiled words index is truncated')
+			self._buf = buf
+			self._blob_start = pos
+			self.path = None
+
+		def __reduce__(self):
+			# Mapped indexes are reopened by path instead of copying their contents
+			if self.path:
+				return (WordDictionary.mapIndex, (self.path,))
+			return (WordDictionary.WordIndex, (bytes(self._buf),))
+
+		def __len__(self):
+			return len(self.offsets)-1
+
+		def lengths(self):
+			return len(self.starts)-1
+
+		def loaded(self):
+			# Every length is available as soon as the index is mapped
+			return list(range(self.lengths()))
+
+		def nbytes(self):
+			# Size of the compiled index, mapped or in memory
+			return len(self._buf)
+
+		def word(self, i):
+			return self._buf[self._blob_start+self.offsets[i]:self._blob_start+self.offsets[i+1]].decode('utf-8')
+
+		def bucket(self, length):
+			if length >= self.lengths():
+				return []
+			return [self.word(i) for i in range(self.starts[length], self.starts[length+1])]
+
+		@staticmethod
+		def _uint32s(buf, pos, count):
+			if sys.byteorder == 'little':
+				return memoryview(buf)[pos:pos+4*count].cast('I')
+			values = array('I')
+			values.frombytes(buf[pos:pos+4*count])
+			values.byteswap()
+			return values
+
+		@staticmethod
+		def compile(buckets, source_size=0, source_mtime=0):
+			# `buckets` holds the collection of words of each length, starting from length 0
+			starts = array('I', [0])
+			offsets = array('I', [0])
+			blob = bytearray()
+			for bucket in buckets:
+				for w in sorted(bucket):
+					blob += w.encode('utf-8')
+					offsets.append(len(blob))
+				starts.append(len(offsets)-1)
+			# Trailing lengths without any words are left out, like `LengthSetMap.maxlength`
+			while len(starts) > 2 and starts[-1] == starts[-2]:
+				starts.pop()
+			if sys.byteorder != 'little':
+				starts.byteswap()
+				offsets.byteswap()
+			header = WordDictionary.WordIndex.header.pack(WordDictionary.WordIndex.magic, source_size, source_mtime, len(starts)-1, len(offsets)-1)
+			return header + starts.tobytes() + offsets.tobytes() + bytes(blob)
+
+	class WordView:
+		"""Filtered subset of a `WordIndex`, stored as the parent's indexes of the kept words.
+
+		Behaves like the `WordIndex` it was built from (same `starts`, `word` and `bucket`), so
+		sampling costs one extra array lookup. Saved views use the `WordIndex` layout, with
+		`positions` in place of `offsets` and the blob, and the digest of the filter spec:
+
+		    header      magic, source size, source mtime, length count `L`, word count `N`, digest
+		    starts      `L+1` uint32 values, the index of the first kept word of each length
+		    positions   `N` uint32 values, the parent index of each kept word
+		"""
+		magic = b'PWGDVIW1'
+		header = struct.Struct('<8sQqII20s')
+
+		def __init__(self, parent, starts, positions, digest=b''):
+			self.parent = parent
+			self.starts = starts
+			self.positions = positions
+			self.digest = digest
+			self.source_size = parent.source_size
+			self.source_mtime = parent.source_mtime
+			self.path = None
+
+		def __reduce__(self):
+			return (WordDictionary.WordView, (self.parent, array('I', self.starts), array('I', self.positions), self.digest))
+
+		def __len__(self):
+			return len(self.positions)
+
+		def lengths(self):
+			return len(self.starts)-1
+
+		def loaded(self):
+			return self.parent.loaded()
+
+		def nbytes(self):
+			# Only the view's own arrays, the words stay in the parent
+			return 4*(len(self.starts)+len(self.positions))
+
+		def word(self, i):
+			return self.parent.word(self.positions[i])
+
+		def bucket(self, length):
+			if length >= self.lengths():
+				return []
+			return [self.word(i) for i in range(self.starts[length], self.starts[length+1])]
+
+		def dump(self):
+			starts = array('I', self.starts)
+			positions = array('I', self.positions)
+			if sys.byteorder != 'little':
+				starts.byteswap()
+				positions.byteswap()
+			header = WordDictionary.WordView.header.pack(WordDictionary.WordView.magic, self.source_size, self.source_mtime,
+														len(self.starts)-1, len(self.positions), self.digest)
+			return header + starts.tobytes() + positions.tobytes()
+
+		@staticmethod
+		def load(buf, parent, digest):
+			# Raises ValueError unless `buf` holds the view with `digest` of this version of `parent`
+			View = WordDictionary.WordView
+			if len(buf) < View.header.size:
+				raise ValueError('Saved words view is truncated')
+			magic, source_size, source_mtime, nlengths, nwords, saved_digest = View.header.unpack_from(buf, 0)
+			if magic != View.magic:
+				raise ValueError('Not a saved words view')
+			if (source_size, source_mtime, saved_digest) != (parent.source_size, parent.source_mtime, digest):
+				raise ValueError('Saved words view is out of date')
+			if len(buf) != View.header.size+4*(nlengths+1+nwords):
+				raise ValueError('Saved words view is truncated')
+			pos = View.header.size
+			starts = WordDictionary.WordIndex._uint32s(buf, pos, nlengths+1)
+			positions = WordDictionary.WordIndex._uint32s(buf, pos+4*(nlengths+1), nwords)
+			return View(parent, starts, positions, digest)
+
+	class LazyIndex:
+		"""Index over a formatted words file, used when its compiled index cannot be saved.
+
+		Opening it only records where each line (one per length) starts and how many words it
+		holds, without splitting anything. A length's words are split and sorted the first
+		time one of them is needed, so patterns only pay for the lengths they use. Word
+		counts come from the separators, so the file must be formatted, as written by
+		`setWordsFile`.
+		"""
+		def __init__(self, words_file):
+			stat = os.stat(words_file)
+			self.source_size = stat.st_size
+			self.source_mtime = stat.st_mtime_ns
+			self.words_file = words_file
+			self.path = None
+			with open(words_file, 'rb') as f:
+				buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+			# `lines[length]` is the byte range of that length's line, `starts` as in `WordIndex`
+			self.lines = [None]
+			self.starts = array('I', [0, 1])
+			pos = 0
+			while pos < len(buf):
+				end = buf.find(b'\n', pos)
+				if end < 0:
+					end = len(buf)
+				line = buf[pos:end]
+				count = line.count(b',')+1 if line.strip() else 0
+				self.lines.append((pos, end))
+				self.starts.append(self.starts[-1]+count)
+				pos = end+1
+			while len(self.starts) > 2 and self.starts[-1] == self.starts[-2]:
+				self.starts.pop()
+				self.lines.pop()
+			self._buf = buf
+			self._buckets = {0: ['']}
+
+		def __reduce__(self):
+			return (WordDictionary.LazyIndex, (self.words_file,))
+
+		def __len__(self):
+			return self.starts[-1]
+
+		def lengths(self):
+			return len(self.starts)-1
+
+		def loaded(self):
+			return sorted(self._buckets)
+
+		def nbytes(self):
+			# Bytes of the lines loaded so far
+			return sum(self.lines[length][1]-self.lines[length][0] for length in self._buckets if length)
+
+		def word(self, i):
+			length = bisect_right(self.starts, i)-1
+			bucket = self._buckets.get(length)
+			if bucket is None:
+				bucket = self.bucket(length)
+			return bucket[i-self.starts[length]]
+
+		def bucket(self, length):
+			if length >= self.lengths():
+				return []
+			bucket = self._buckets.get(length)
+			if bucket is None:
+				start, end = self.lines[length]
+				words = {w.strip() for w in self._buf[start:end].decode('utf-8').split(',')}
+				words.discard('')
+				bucket = sorted(words)
+				if len(bucket) != self.starts[length+1]-self.starts[length]:
+					raise ValueError('Words file %r is not formatted, set it again with `-w` or `-l`' % self.words_file)
+				self._buckets[length] = bucket
+			return bucket
+
+	class AliasTable:
+		"""Vose alias table, for drawing from fixed weights in constant time.
+
+		A draw picks a slot uniformly, then keeps it if a uniform 32-bit fraction is below
+		`thresholds[slot]`, and takes `aliases[slot]` otherwise; both come from one draw below
+		`len(table) << 32`. Thresholds are rounded to 32 bits, so each probability is off from
+		its exact weight by less than `2**-32`. Draws are `offset` plus a slot.
+		"""
+		bits = 32
+
+		def __init__(self, weights, offset=0):
+			n = len(weights)
+			total = math.fsum(weights)
+			if not n or total <= 0:
+				raise ValueError('Cannot draw from weights that are all zero')
+			one = 1 << WordDictionary.AliasTable.bits
+			scaled = [w*n/total for w in weights]
+			small = [i for i, p in enumerate(scaled) if p < 1]
+			large = [i for i, p in enumerate(scaled) if p >= 1]
+			self.thresholds = array('Q', [one])*n
+			self.aliases = array('I', range(n))
+			while small and large:
+				s, l = small.pop(), large.pop()
+				self.thresholds[s] = int(round(scaled[s]*one))
+				self.aliases[s] = l
+				scaled[l] -= 1-scaled[s]
+				(small if scaled[l] < 1 else large).append(l)
+			# Whatever is left is within rounding of 1, and keeps its slot
+			self.offset = offset
+
+		def __len__(self):
+			return len(self.aliases)
+
+		def sample(self, randbelow):
+			r = randbelow(len(self.aliases) << WordDictionary.AliasTable.bits)
+			slot = r >> WordDictionary.AliasTable.bits
+			if r & ((1 << WordDictionary.AliasTable.bits)-1) < self.thresholds[slot]:
+				return self.offset+slot
+			return self.offset+self.aliases[slot]
+
+
+	def __init__(self, words_file, wordmap=None, index=None):
 		self.words_file = words_file
-		if not wordmap:
-			wordmap = WordDictionary.parse(self.words_file, formatted=True)
-		self.wordmap = wordmap
+		start = time.time()
+		if index is None:
+			if wordmap is None:
+				index = WordDictionary.loadIndex(self.words_file)
+			else:
+				index = WordDictionary.WordIndex(WordDictionary.WordIndex.compile(wordmap[:wordmap.maxlength()+1]))
+		self.index = index
+		self._wordmap = wordmap
+		self.ingest_stats = None
+		# Filtered views of this dictionary, see `view`
+		self.parent = None
+		self._views = {}
+		# Per-word weights for `sample_word` (None for uniform draws), see `weighted`
+		self.weights = None
+		self._counts = None
+		self._aliases = {}
+		# For `Stats`
+		self.load_seconds = time.time()-start
+
+	@property
+	def wordmap(self):
+		# Built on demand, the compiled index is used for everything internally
+		if self._wordmap is None:
+			wordmap = WordDictionary.LengthSetMap()
+			for length in range(1, self.index.lengths()):
+				for w in self.index.bucket(length):
+					wordmap.add(w, length)
+			self._wordmap = wordmap
+		return self._wordmap
+
+	def loadedLengths(self):
+		# Word lengths whose words are in memory (every length, unless the index is lazy)
+		return self.index.loaded()
 
 	def getWordPool(self, length_lower=None, length_upper=None):
+		start, stop = self.wordRange(length_lower, length_upper)
+		return {self.index.word(i) for i in range(start, stop)}
+
+	def sample_word(self, length_lower=None, length_upper=None, rng=None):
+		# One of the same words `getWordPool` would return, without building the pool.
+		# Uniform, unless the dictionary is `weighted`
+		start, stop = self.wordRange(length_lower, length_upper)
+		rng = (rng or DEFAULT_RANDOM).local()
+		rng.words_drawn += 1
+		if self.weights is not None:
+			return self.index.word(self.aliasTable(start, stop).sample(rng.randbelow))
+		return self.index.word(start+rng.randbelow(stop-start))
+
+	def aliasTable(self, start, stop):
+		# `AliasTable` over the weights of words `start..stop`, built once per range
+		table = self._aliases.get((start, stop))
+		if table is None:
+			table = self._aliases[(start, stop)] = WordDictionary.AliasTable(self.weights[start:stop], start)
+		return table
+
+	def lengthCounts(self, length_lower=None, length_upper=None):
+		# `(length, count)` for every length in the words `sample_word` draws from
+		start, stop = self.wordRange(length_lower, length_upper)
+		starts = self.index.starts
+		counts = []
+		for length in range(len(starts)-1):
+			count = min(stop, starts[length+1]) - max(start, starts[length])
+			if count > 0:
+				counts.append((length, count))
+		return counts
+
+	def weightClasses(self, length_lower=None, length_upper=None):
+		# `(length, count, p)`: `count` words of that length that `sample_word` each draws with probability `p`
+		counts = self.lengthCounts(length_lower, length_upper)
+		start, stop = self.wordRange(length_lower, length_upper)
+		if self.weights is None:
+			return [(length, count, 1/(stop-start)) for length, count in counts]
+		total = math.fsum(self.weights[start:stop])
+		starts = self.index.starts
+		classes = []
+		for length, _ in counts:
+			for weight, count in sorted(Counter(self.weights[max(start, starts[length]):min(stop, starts[length+1])]).items()):
+				if weight:
+					classes.append((length, count, weight/total))
+		return classes
+
+	def entropy(self, length_lower=None, length_upper=None):
+		# Shannon entropy of one `sample_word` draw, in bits (log2 of the number of words when uniform)
+		return 0.0 - sum(count*p*math.log2(p) for _, count, p in self.weightClasses(length_lower, length_upper))
+
+	def minEntropy(self, length_lower=None, length_upper=None):
+		# Bits an attacker gains nothing over by always guessing the likeliest word
+		return 0.0 - math.log2(max(p for _, _, p in self.weightClasses(length_lower, length_upper)))
+
+	def wordRange(self, length_lower=None, length_upper=None):
+		# Words are stored grouped by length, so any length range is a contiguous run of indexes
 		if not length_upper:
 			length_upper = length_lower
+		starts = self.index.starts
+		last = len(starts)-1
 
 		if length_lower != None:
-			pool = {w for lenset in self.wordmap[length_lower:length_upper+1] for w in lenset}
+			start, stop = starts[min(length_lower, last)], starts[min(length_upper+1, last)]
+		else:
+			start = stop = 0
+
+		if start >= stop:
+			start, stop = starts[min(1, last)], starts[last]
+			if start >= stop:
+				start, stop = starts[0], starts[min(1, last)]
+		return start, stop
+
+	def view(self, length_lower=None, length_upper=None, charclass=None, regex=None, blocklist=None, allowlist=None, path=None):
+		"""Dictionary of the words that pass every given filter, sharing this dictionary's storage.
+
+		- `length_lower`, `length_upper`: bounds on word length (either may be None)
+		- `charclass`: regex character class body every character must belong to, e.g. `'a-z'`
+		- `regex`: pattern the word must contain a match for (use anchors to match whole words)
+		- `blocklist`, `allowlist`: words to drop or to keep, compared case-insensitively
+		Views are computed once and cached on this dictionary. If `path` is given the view is
+		loaded from that file when it was saved for the same filters and words file, and saved
+		there otherwise. The view samples like any `WordDictionary`, so it can go to `Pattern`.
+		Raises ValueError if no word passes the filters.
+		"""
+		blocklist = frozenset(w.lower() for w in blocklist) if blocklist is not None else None
+		allowlist = frozenset(w.lower() for w in allowlist) if allowlist is not None else None
+		regex = regex.pattern if hasattr(regex, 'pattern') else regex
+		spec = (length_lower, length_upper, charclass, regex,
+				tuple(sorted(blocklist)) if blocklist is not None else None,
+				tuple(sorted(allowlist)) if allowlist is not None else None)
+		worddict = self._views.get(spec)
+		if worddict is not None:
+			return worddict
+		digest = hashlib.sha1(repr(spec).encode('utf-8')).digest()
+		index = None
+		if path:
+			try:
+				with open(path, 'rb') as f:
+					buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				index = WordDictionary.WordView.load(buf, self.index, digest)
+				index.path = path
+			except (IOError, OSError, ValueError, struct.error):
+				index = None
+		if index is None:
+			keep = WordDictionary.wordFilter(charclass, regex, blocklist, allowlist)
+			starts, positions = array('I', [0]), array('I', [0])
+			lower = 1 if length_lower is None else max(length_lower, 1)
+			upper = self.index.lengths()-1 if length_upper is None else min(length_upper, self.index.lengths()-1)
+			for length in range(1, self.index.lengths()):
+				starts.append(len(positions))
+				if lower <= length <= upper:
+					word = self.index.word
+					positions.extend(i for i in range(self.index.starts[length], self.index.starts[length+1]) if keep(word(i)))
+			starts.append(len(positions))
+			# Trailing lengths without any words are left out, as in `WordIndex.compile`
+			while len(starts) > 2 and starts[-1] == starts[-2]:
+				starts.pop()
+			index = WordDictionary.WordView(self.index, starts, positions, digest)
+			if path:
+				WordDictionary.writeAtomic(path, index.dump())
+		# Only the empty word left: sampling would quietly fall back to it
+		if len(index) <= index.starts[min(1, index.lengths())]:
+			raise ValueError('No word of %r passes the word filters' % self.words_file)
+		worddict = WordDictionary(self.words_file, index=index)
+		worddict.parent = self
+		self._views[spec] = worddict
+		return worddict
+
+	@staticmethod
+	def wordFilter(charclass=None, regex=None, blocklist=None, allowlist=None):
+		# Predicate for `view`, with blocklist and allowlist already lowercased
+		checks = []
+		if charclass is not None:
+			checks.append(re.compile('[{}]*'.format(charclass)).fullmatch)
+		if regex is not None:
+			checks.append(re.compile(regex).search)
+		if blocklist is not None:
+			checks.append(lambda w: w.lower() not in blocklist)
+		if allowlist is not None:
+			checks.append(lambda w: w.lower() in allowlist)
+		return lambda w: all(check(w) for check in checks)
+
+	def counts(self):
+		# How many times each word appeared when the words file was made with `-w`, in index order
+		if self._counts is None:
+			if self.parent is None:
+				self._counts = WordDictionary.readCounts(self.words_file, self.index)
+			elif self.index is self.parent.index:
+				self._counts = self.parent.counts()
+			else:
+				parent_counts = self.parent.counts()
+				self._counts = array('I', (parent_counts[i] for i in self.index.positions))
+		return self._counts
+
+	def weighted(self, exponent=1.0, top=None):
+		"""Dictionary drawing each word with probability proportional to `count**exponent`.
+
+		Counts are how often each word appeared in the text the words file was made from
+		(see `countsFile`). An `exponent` of 1 follows the text, 0 is uniform, and values in
+		between flatten the difference between common and rare words. With `top`, only the
+		`top` most common words are kept (ties go to the earlier word). Draws use an alias table
+		per length range, so they cost the same as uniform ones once it is built. `entropy` and
+		`Pattern.entropy` report the entropy of the weighted draws.
+		Raises ValueError if this dictionary has no counts, or no word with a count.
+		"""
+		if top is not None and top < 1:
+			raise ValueError('`top` must be at least 1')
+		spec = ('weighted', exponent, top)
+		worddict = self._views.get(spec)
+		if worddict is not None:
+			return worddict
+		counts = self.counts()
+		index = self.index
+		# Words from length 1 on, leaving out the empty word
+		first = index.starts[min(1, index.lengths())]
+		if top is not None and top < len(counts)-first:
+			positions = array('I', sorted(sorted(range(first, len(counts)), key=lambda i: -counts[i])[:top]))
+			starts = array('I', (bisect_left(positions, i) for i in index.starts))
+			while len(starts) > 2 and starts[-1] == starts[-2]:
+				starts.pop()
+			digest = hashlib.sha1(repr(spec).encode('utf-8')).digest()
+			index = WordDictionary.WordView(index, starts, positions, digest)
+			counts = array('I', (counts[i] for i in positions))
+		worddict = WordDictionary(self.words_file, index=index)
+		worddict.parent = self
+		worddict._counts = counts
+		worddict.weights = array('d', (c**exponent if c else 0.0 for c in counts))
+		if not any(worddict.weights[index.starts[min(1, index.lengths())]:]):
+			raise ValueError('No word of %r has a count to draw it by' % self.words_file)
+		self._views[spec] = worddict
+		return worddict
+
+	# Callbacks run with the path of a words file whenever it is replaced. Bound methods are
+	# held weakly, so listening does not keep their object (e.g. a `DictionaryRegistry`) alive
+	listeners = []
+
+	@staticmethod
+	def onChange(callback):
+		if isinstance(callback, types.MethodType):
+			ref = weakref.WeakMethod(callback)
 		else:
-			pool = set()
+			ref = lambda: callback
+		WordDictionary.listeners.append(ref)
 
-		if not pool:
-			pool = {w for lenset in self.wordmap[1:] for w in lenset}
-			if not pool:
-				pool = {w for w in self.wordmap[0]}
-		return pool
+	@staticmethod
+	def notifyChange(words_file):
+		live = []
+		for ref in WordDictionary.listeners:
+			callback = ref()
+			if callback is not None:
+				live.append(ref)
+				callback(words_file)
+		WordDictionary.listeners[:] = live
+
+	@staticmethod
+	def indexFile(words_file):
+		return words_file+'.idx'
+
+	@staticmethod
+	def countsFile(words_file):
+		# Word counts kept by `-w`: one line per length, with the count of each word of the line, in order
+		return words_file+'.freq'
+
+	@staticmethod
+	def readCounts(words_file, index):
+		# The counts of `countsFile(words_file)` as an array in index order, checked against `index`
+		counts_file = WordDictionary.countsFile(words_file)
+		if not os.path.isfile(counts_file):
+			raise ValueError('There are no word counts for %r, set the words file with `-w` to keep them' % words_file)
+		counts = array('I', [0])
+		with open(counts_file, 'r') as f:
+			for length, line in enumerate(f, 1):
+				counts.extend(int(c) for c in line.split(',') if c.strip())
+				if len(counts) != index.starts[min(length+1, index.lengths())]:
+					raise ValueError('The word counts in %r do not match %r, set the words file again with `-w`' % (counts_file, words_file))
+		if len(counts) != len(index):
+			raise ValueError('The word counts in %r do not match %r, set the words file again with `-w`' % (counts_file, words_file))
+		return counts
+
+	@staticmethod
+	def loadIndex(words_file):
+		# Map the compiled index, recompiling it if it is missing or out of date
+		stat = os.stat(words_file)
+		try:
+			index = WordDictionary.mapIndex(WordDictionary.indexFile(words_file))
+		except (IOError, OSError, ValueError, struct.error):
+			pass
+		else:
+			if index.source_size == stat.st_size and index.source_mtime == stat.st_mtime_ns:
+				return index
+		# Without a saved index, loading only the lengths that are used beats compiling them all
+		index_file = WordDictionary.indexFile(words_file)
+		if not os.access(os.path.dirname(index_file) or os.curdir, os.W_OK) or (os.path.exists(index_file) and not os.access(index_file, os.W_OK)):
+			return WordDictionary.LazyIndex(words_file)
+		return WordDictionary.compileIndex(words_file)
+
+	@staticmethod
+	def mapIndex(index_file):
+		with open(index_file, 'rb') as f:
+			buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		index = WordDictionary.WordIndex(buf)
+		index.path = index_file
+		return index
+
+	@staticmethod
+	def compileIndex(words_file):
+		# Write the index next to the words file, or keep it in memory if that is not possible
+		stat = os.stat(words_file)
+		buckets = [{''}] + list(WordDictionary.readBuckets(words_file))
+		data = WordDictionary.WordIndex.compile(buckets, stat.st_size, stat.st_mtime_ns)
+		index_file = WordDictionary.indexFile(words_file)
+		if WordDictionary.writeAtomic(index_file, data):
+			try:
+				return WordDictionary.mapIndex(index_file)
+			except (IOError, OSError):
+				pass
+		return WordDictionary.WordIndex(data)
+
+	@staticmethod
+	def writeAtomic(file_path, data):
+		# Replace `file_path` with `data` in one step, returning False if it could not be written
+		temp_file = None
+		try:
+			fd, temp_file = mkstemp(dir=os.path.dirname(file_path) or os.curdir)
+			with os.fdopen(fd, 'wb') as f:
+				f.write(data)
+			os.chmod(temp_file, 0o644)
+			os.replace(temp_file, file_path)
+			return True
+		except (IOError, OSError):
+			if temp_file and os.path.exists(temp_file):
+				os.remove(temp_file)
+			return False
 
 	@staticmethod
 	def parse(file_path, formatted=False):
@@ -96,73 +697,227 @@ class WordDictionary:
 							wordmap.add(w)
 		return wordmap
 
+	@staticmethod
+	def readBuckets(file_path):
+		# Stream the set of words on each line of a formatted words file
+		with open(file_path, 'r') as f:
+			for line in f:
+				bucket = {w.strip() for w in line.split(',')}
+				bucket.discard('')
+				yield bucket
+
+	@staticmethod
+	def readCountBuckets(file_path):
+		# Stream `{word: count}` for each line of a formatted words file and its counts file
+		counts_file = WordDictionary.countsFile(file_path)
+		with open(file_path, 'r') as f, open(counts_file, 'r') as counts:
+			for line, count_line in zip_longest(f, counts, fillvalue=''):
+				words, line_counts = line.split(','), count_line.split(',')
+				if len(words) != len(line_counts) and line.strip():
+					raise ValueError('The word counts in %r do not match %r' % (counts_file, file_path))
+				bucket = {}
+				for w, count in zip(words, line_counts):
+					w = w.strip()
+					if w:
+						bucket[w] = bucket.get(w, 0)+int(count)
+				yield bucket
+
+	@staticmethod
+	def writeBuckets(buckets, out, counts_out=None):
+		# Write word buckets (or `{word: count}` buckets, with `counts_out`) as formatted lines
+		empty = 0
+		first = True
+		for bucket in buckets:
+			if not bucket:
+				empty += 1
+				continue
+			sep = '\n'*(empty+(0 if first else 1))
+			words = sorted(bucket)
+			out.write(sep + ','.join(words))
+			if counts_out is not None:
+				counts_out.write(sep + ','.join(str(bucket[w]) for w in words))
+			empty = 0
+			first = False
+
+	@staticmethod
+	def formatFile(file_path, out_file, counts_file=None):
+		# Normalize a formatted words file one line at a time. Its counts are written to
+		# `counts_file` if it has any, returning whether they were
+		with_counts = counts_file is not None and os.path.isfile(WordDictionary.countsFile(file_path))
+		with open(out_file, 'w') as out:
+			if with_counts:
+				with open(counts_file, 'w') as counts_out:
+					WordDictionary.writeBuckets(WordDictionary.readCountBuckets(file_path), out, counts_out)
+			else:
+				WordDictionary.writeBuckets(WordDictionary.readBuckets(file_path), out)
+		return with_counts
+
+	@staticmethod
+	def mergeFiles(words_file, new_file, out_file, counts_file=None):
+		# Formatted union of two formatted words files, only splitting the lines `new_file` adds words to.
+		# If both have counts, the summed counts are written to `counts_file`, returning whether they were
+		if counts_file is not None and all(os.path.isfile(WordDictionary.countsFile(f)) for f in (words_file, new_file)):
+			old, new = WordDictionary.readCountBuckets(words_file), WordDictionary.readCountBuckets(new_file)
+			with open(out_file, 'w') as out, open(counts_file, 'w') as counts_out:
+				buckets = []
+				for bucket, new_bucket in zip_longest(old, new):
+					bucket = bucket or {}
+					for w, count in (new_bucket or {}).items():
+						bucket[w] = bucket.get(w, 0)+count
+					buckets.append(bucket)
+				WordDictionary.writeBuckets(buckets, out, counts_out)
+			return True
+		lines = []
+		with open(words_file, 'r') as old, open(new_file, 'r') as new:
+			for line, new_line in zip_longest(old, new, fillvalue=''):
+				line, new_line = line.rstrip('\n'), new_line.strip()
+				if new_line:
+					bucket = {w.strip() for w in (line+','+new_line).split(',')}
+					bucket.discard('')
+					line = ','.join(sorted(bucket))
+				lines.append(line)
+		while lines and not lines[-1].strip():
+			lines.pop()
+		with open(out_file, 'w') as out:
+			out.write('\n'.join(lines))
+		return False
+
+	@staticmethod
+	def link(src, dst):
+		# Atomically make `dst` a hard link to `src` (a copy where links are not supported)
+		fd, temp_file = mkstemp(dir=os.path.dirname(dst) or os.curdir)
+		os.close(fd)
+		try:
+			os.remove(temp_file)
+			try:
+				os.link(src, temp_file)
+			except OSError:
+				if not os.path.exists(src):
+					raise
+				copy2(src, temp_file)
+			os.replace(temp_file, dst)
+		finally:
+			if os.path.exists(temp_file):
+				os.remove(temp_file)
+
 	@staticmethod
 	def backup(words_file):
-		# Copy old `words.txt` to `words.txt.old`
+		# Make `words.txt.old` the current `words.txt` (and its compiled index and counts), without copying it
+		old_file = words_file+'.old'
 		try:
-			with open(words_file, 'r') as f:
-				with open(words_file+'.old', 'w') as old:
-					copyfileobj(f, old)
-		except IOError:
+			WordDictionary.link(words_file, old_file)
+		except FileNotFoundError:
 			printerr('No formatted words file could be found at %r, skipping backup' % words_file)
-		except:
-			printerr('Could not backup words file from %r to %r' % (words_file, words_file+'.old'))
-		else:
-			return True
-		return False
+			return False
+		except OSError:
+			printerr('Could not backup words file from %r to %r' % (words_file, old_file))
+			return False
+		for sidecar in (WordDictionary.indexFile, WordDictionary.countsFile):
+			try:
+				WordDictionary.link(sidecar(words_file), sidecar(old_file))
+			except FileNotFoundError:
+				# Counts left from an older backup would not match it
+				if os.path.exists(sidecar(old_file)):
+					os.remove(sidecar(old_file))
+			except OSError:
+				pass
+		return True
 
 	@staticmethod
 	def revert(words_file):
-		# Revert `words.txt.old` to `words.txt`
-		_, temp_file = mkstemp()
+		# Swap `words.txt.old` and `words.txt` with renames, so `words.txt` is always complete
 		old_file = words_file+'.old'
-		try: 
-			with open(old_file, 'r') as old:
-				with open(temp_file, 'w') as temp:
-					copyfileobj(old, temp)
-		except IOError:
+		if not os.path.isfile(old_file):
 			printerr('No backup file found at %r' % old_file)
-		except:
-			printerr('Could not load backup file %r' % old_file)
-		else:
-			if WordDictionary.backup(words_file):
-				try:
-					with open(temp_file, 'r') as temp:
-						with open(words_file, 'w') as f:
-							copyfileobj(temp, f)
-				except IOError:
-					printerr('No words file found at %r' % words_file)
-				except:
-					printerr('Could not revert backup to %r, attempting to restore overwritten backup' % words_file)
-					try: 
-						with open(temp_file, 'r') as temp:
-							with open(old_file, 'w') as old:
-								copyfileobj(temp, old)
-					except:
-						printerr('Could not restore the overwritten backup. Backup is lost.')
+			return False
+		if not os.path.isfile(words_file):
+			printerr('No words file found at %r' % words_file)
+			return False
+		for sidecar in (str, WordDictionary.indexFile, WordDictionary.countsFile):
+			src, dst = sidecar(words_file), sidecar(old_file)
+			# Keep the current file under a temporary name until the backup has taken its place
+			had_src = os.path.exists(src)
+			if not had_src and not os.path.exists(dst):
+				continue
+			fd, temp_file = mkstemp(dir=os.path.dirname(words_file) or os.curdir)
+			os.close(fd)
+			try:
+				if had_src:
+					WordDictionary.link(src, temp_file)
+				if os.path.exists(dst):
+					os.replace(dst, src)
+				elif src == words_file:
+					raise FileNotFoundError(dst)
+				else:
+					# No index or counts for the backup, the index is compiled when the words file is next loaded
+					os.remove(src)
+				if had_src:
+					os.replace(temp_file, dst)
 				else:
 					os.remove(temp_file)
-					return True
-		os.remove(temp_file)
-		return False
+			except OSError:
+				if os.path.exists(temp_file):
+					os.remove(temp_file)
+				if src == words_file:
+					printerr('Could not revert backup to %r' % words_file)
+					return False
+		WordDictionary.notifyChange(words_file)
+		return True
 
 	@staticmethod
-	def setWordsFile(words_file, file_path, backup=True, formatted=False):
-		# Read input file
-		try:
-			wordmap = WordDictionary.parse(file_path, formatted)
-		except FileNotFoundError:
+	def setWordsFile(words_file, file_path, backup=True, formatted=False, jobs=None, progress=None, append=False):
+		# Write the new words file next to the current one, streaming from the input file.
+		# With `append`, the words are added to those already in the current words file
+		if not os.path.isfile(file_path):
 			printerr('Could not find file %r' % file_path)
 			return None
+		temp_file = new_file = None
+		stats = None
+		try:
+			fd, temp_file = mkstemp(dir=os.path.dirname(words_file) or os.curdir)
+			os.close(fd)
+			if append and os.path.isfile(words_file):
+				fd, new_file = mkstemp(dir=os.path.dirname(words_file) or os.curdir)
+				os.close(fd)
+			# Word counts are kept next to each file, when the input has them
+			counts_file = WordDictionary.countsFile(new_file or temp_file)
+			if formatted:
+				WordDictionary.formatFile(file_path, new_file or temp_file, counts_file)
+			else:
+				stats = ingest.ingest(file_path, new_file or temp_file, jobs, progress, counts_file=counts_file)
+			if new_file:
+				WordDictionary.mergeFiles(words_file, new_file, temp_file, WordDictionary.countsFile(temp_file))
+			os.chmod(temp_file, 0o644)
+		except Exception as e:
+			printerr('Could not write new words file: %s' % e)
+			for f in (temp_file, temp_file and WordDictionary.countsFile(temp_file)):
+				if f and os.path.exists(f):
+					os.remove(f)
+			return None
+		finally:
+			for f in (new_file, new_file and WordDictionary.countsFile(new_file)):
+				if f and os.path.exists(f):
+					os.remove(f)
 		# Backup words file
 		if backup:
 			WordDictionary.backup(words_file)
-		# Write new words file
-		try: 
-			with open(words_file, 'w') as f:
-				f.write(str(wordmap))
-		except Exception as e:
+		# Install new words file, after its counts (or removing counts that no longer match)
+		temp_counts, counts_file = WordDictionary.countsFile(temp_file), WordDictionary.countsFile(words_file)
+		try:
+			if os.path.exists(temp_counts):
+				os.chmod(temp_counts, 0o644)
+				os.replace(temp_counts, counts_file)
+			elif os.path.exists(counts_file):
+				os.remove(counts_file)
+			os.replace(temp_file, words_file)
+		except OSError as e:
 			printerr('Could not write new words file: %s' % e)
+			for f in (temp_file, temp_counts):
+				if os.path.exists(f):
+					os.remove(f)
 			return None
-		# Return wordmap
-		return WordDictionary(words_file, wordmap)
\ No newline at end of file
+		WordDictionary.notifyChange(words_file)
+		# Compile index and return wordmap
+		worddict = WordDictionary(words_file, index=WordDictionary.compileIndex(words_file))
+		worddict.ingest_stats = stats
+		return worddict
@@ -0,0 +1,71 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+from src.worddict import WordDictionary
+
+# Formatted words file: the words of length `n` on line `n`
+WORDS = ['a,i', 'an,at,be', '', 'over,that,this', 'héllo']
+
+def write_words(path, lines=WORDS):
+	path.write_text('\n'.join(lines), encoding='utf-8')
+	return str(path)
+
+def test_write_atomic(tmp_path):
+	path = str(tmp_path/'file')
+	assert WordDictionary.writeAtomic(path, b'first')
+	assert WordDictionary.writeAtomic(path, b'second')
+	with open(path, 'rb') as f:
+		assert f.read() == b'second'
+	assert os.listdir(str(tmp_path)) == ['file']
+
+def test_write_atomic_failure_leaves_nothing(tmp_path):
+	assert not WordDictionary.writeAtomic(str(tmp_path/'missing'/'file'), b'data')
+	target = tmp_path/'dir'
+	target.mkdir()
+	# Cannot replace a directory with a file: the temporary file is removed
+	assert not WordDictionary.writeAtomic(str(target), b'data')
+	assert sorted(os.listdir(str(tmp_path))) == ['dir']
+
+def test_backup_and_revert(tmp_path):
+	words_file = write_words(tmp_path/'words.txt', ['a', 'an'])
+	WordDictionary.compileIndex(words_file)
+	assert WordDictionary.backup(words_file)
+	assert os.path.samefile(words_file, words_file+'.old')
+	assert os.path.exists(WordDictionary.indexFile(words_file+'.old'))
+
+	# Replace the words file (and its index), then swap the backup back in
+	os.remove(words_file)
+	write_words(tmp_path/'words.txt', ['i', 'be', 'the'])
+	WordDictionary.compileIndex(words_file)
+	assert WordDictionary.revert(words_file)
+	with open(words_file) as f:
+		assert f.read() == 'a\nan'
+	with open(words_file+'.old') as f:
+		assert f.read() == 'i\nbe\nthe'
+	assert WordDictionary.loadIndex(words_file).bucket(2) == ['an']
+	assert WordDictionary.loadIndex(words_file+'.old').bucket(3) == ['the']
+
+	# Reverting again swaps them back
+	assert WordDictionary.revert(words_file)
+	with open(words_file) as f:
+		assert f.read() == 'i\nbe\nthe'
+
+def test_revert_without_backup(tmp_path):
+	words_file = write_words(tmp_path/'words.txt')
+	assert not WordDictionary.revert(words_file)
+	with open(words_file, encoding='utf-8') as f:
+		assert f.read() == '\n'.join(WORDS)
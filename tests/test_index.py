@@ -0,0 +1,76 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import pickle
+
+import pytest
+
+from src.worddict import WordDictionary
+
+WordIndex = WordDictionary.WordIndex
+
+# Formatted words file: the words of length `n` on line `n`
+WORDS = ['a,i', 'an,at,be', '', 'over,that,this', 'héllo']
+
+def write_words(path, lines=WORDS):
+	path.write_text('\n'.join(lines), encoding='utf-8')
+	return str(path)
+
+def buckets(lines=WORDS):
+	return [{''}] + [set(filter(None, line.split(','))) for line in lines]
+
+def test_word_index_round_trip():
+	index = WordIndex(WordIndex.compile(buckets(), 12, 34))
+	assert (index.source_size, index.source_mtime) == (12, 34)
+	assert len(index) == 10
+	assert index.lengths() == 6
+	for length, bucket in enumerate(buckets()):
+		assert index.bucket(length) == sorted(bucket)
+	assert index.bucket(6) == []
+	assert [index.word(i) for i in range(len(index))] == [w for bucket in buckets() for w in sorted(bucket)]
+
+def test_word_index_drops_trailing_empty_lengths():
+	index = WordIndex(WordIndex.compile(buckets(WORDS[:3] + ['', ''])))
+	assert index.lengths() == 3
+
+def test_word_index_rejects_bad_data():
+	data = WordIndex.compile(buckets())
+	with pytest.raises(ValueError):
+		WordIndex(data[:-1])
+	with pytest.raises(ValueError):
+		WordIndex(b'NOTINDEX' + data[8:])
+	with pytest.raises(ValueError):
+		WordIndex(data[:10])
+
+def test_word_index_file_round_trip(tmp_path):
+	words_file = write_words(tmp_path/'words.txt')
+	compiled = WordDictionary.compileIndex(words_file)
+	assert compiled.path == WordDictionary.indexFile(words_file)
+	loaded = WordDictionary.loadIndex(words_file)
+	stat = os.stat(words_file)
+	assert (loaded.source_size, loaded.source_mtime) == (stat.st_size, stat.st_mtime_ns)
+	for length in range(loaded.lengths()):
+		assert loaded.bucket(length) == compiled.bucket(length)
+	# Mapped indexes pickle by path, in-memory ones by content
+	assert pickle.loads(pickle.dumps(loaded)).bucket(4) == ['over', 'that', 'this']
+	in_memory = WordIndex(WordIndex.compile(buckets()))
+	assert pickle.loads(pickle.dumps(in_memory)).bucket(5) == ['héllo']
+
+def test_stale_index_is_recompiled(tmp_path):
+	words_file = write_words(tmp_path/'words.txt')
+	WordDictionary.compileIndex(words_file)
+	write_words(tmp_path/'words.txt', WORDS[:2])
+	assert WordDictionary.loadIndex(words_file).bucket(4) == []
@@ -0,0 +1,72 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+from collections import Counter
+
+import pytest
+
+from src import ingest
+
+TEXT = ("The quick brown fox jumps over the lazy dog. It's a well-known pangram, "
+		"and the dog -- being lazy -- doesn't mind the fox; naïve foxes don't either.\n")*3
+
+def ingested(tmp_path, text, **kwargs):
+	source = tmp_path/'source.txt'
+	source.write_text(text)
+	stats = ingest.ingest(str(source), str(tmp_path/'words.txt'), jobs=1, counts_file=str(tmp_path/'counts.txt'), **kwargs)
+	return stats, (tmp_path/'words.txt').read_text(), (tmp_path/'counts.txt').read_text()
+
+def parse(words, counts):
+	# `{word: count}` from a formatted words file and its counts file
+	split = lambda text: [item for line in text.split('\n') for item in line.split(',') if item]
+	return dict(zip(split(words), map(int, split(counts))))
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1<<10])
+def test_chunks_never_split_words(size):
+	# On one line, so the cuts must fall between words rather than at newlines
+	text = TEXT.replace('\n', ' ')
+	parts = list(ingest.chunks(io.StringIO(text), size))
+	assert ''.join(parts) == text
+	assert sum((ingest.tokenize(part) for part in parts), Counter()) == ingest.tokenize(text)
+
+def test_chunks_of_one_word():
+	parts = list(ingest.chunks(io.StringIO('a'*1000+"-b'c"), 10))
+	assert parts == ['a'*1000+"-b'c"]
+
+def test_spills_and_merges(tmp_path):
+	stats, words, counts = ingested(tmp_path, TEXT)
+	assert stats.runs == 0
+	expected = ingest.tokenize(TEXT)
+	assert parse(words, counts) == expected
+	assert stats.words() == len(expected)
+	# The words spilled to a run on disk, merged back into the same file
+	small_stats, small_words, small_counts = ingested(tmp_path, TEXT, max_words=4)
+	assert small_stats.runs == 1
+	assert (small_words, small_counts) == (words, counts)
+	assert small_stats.length_counts == stats.length_counts
+
+def test_words_file_layout(tmp_path):
+	_, words, counts = ingested(tmp_path, 'bb a ccc a bb a dddd')
+	assert words.split('\n') == ['a', 'bb', 'ccc', 'dddd']
+	assert counts.split('\n') == ['3', '2', '1', '1']
+
+def test_merges_words_repeated_across_runs(tmp_path, monkeypatch):
+	_, words, counts = ingested(tmp_path, TEXT)
+	chunks = ingest.chunks
+	monkeypatch.setattr(ingest, 'chunks', lambda f: chunks(f, 32))
+	stats, small_words, small_counts = ingested(tmp_path, TEXT, max_words=3)
+	assert stats.runs > 3
+	assert (small_words, small_counts) == (words, counts)
@@ -0,0 +1,74 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import time
+from collections import defaultdict
+from itertools import product
+
+import pytest
+
+from src.pattern import Pattern
+
+def distribution(expression):
+	# Probability of every output of a character expression, by enumerating its plans
+	probabilities = defaultdict(float)
+	plans = expression.plans
+	lengths = range(expression.length_lower, expression.length_upper+1)
+	for plan in plans:
+		for length in lengths:
+			weight = 1/len(plans)/len(lengths)
+			if plan.repeat:
+				strings = [(c*length, plan.pool.count(c)/len(plan.pool)) for c in set(plan.pool)]
+			else:
+				strings = [(''.join(chars), math.prod(plan.pool.count(c)/len(plan.pool) for c in chars)) for chars in product(sorted(set(plan.pool)), repeat=length)]
+			for string, p in strings:
+				if plan.cap_mode == 1:
+					positions = [i for i, c in enumerate(string) if c in Pattern.lowercase]
+					for i in positions:
+						probabilities[string[:i]+string[i].upper()+string[i+1:]] += weight*p/len(positions)
+					if not positions:
+						probabilities[string] += weight*p
+				else:
+					probabilities[string] += weight*p
+	return probabilities
+
+@pytest.mark.parametrize('pattern', [
+	'%d[0-3]', '%c[1-2]', '%w^[1-3]', '%{dw^}[0-3]', '%{dw+^}[1-3]', '%w+[2]', '%{dw~}[1-3]',
+	'%{dc~}[1-2]', '%{dc~^}[1-2]', '%{ds~+^}[0-2]', '%d=[1-4]', '%{dw~=}[0-3]', '%w=^[2-3]',
+])
+def test_keyspace_and_entropy_match_enumeration(pattern):
+	expression = Pattern(pattern).expressions[0]
+	probabilities = distribution(expression)
+	assert expression.keyspace() == len(probabilities)
+	assert math.isclose(sum(probabilities.values()), 1)
+	entropy = -sum(p*math.log2(p) for p in probabilities.values())
+	assert expression.entropy() == pytest.approx(entropy, abs=1e-9)
+
+def test_expressions_multiply():
+	pattern = Pattern('%d[2]%w^[3]')
+	assert pattern.keyspace() == 100 * 26**3*3
+	assert pattern.entropy() == pytest.approx(math.log2(100) + math.log2(26**3*3))
+
+@pytest.mark.parametrize('pattern', ['%c[1-100000]', '%c^[1-100000]', '%{dw~^}[0-100000]'])
+def test_long_length_ranges(pattern):
+	# Closed form in the length for the keyspace, constant work per length for the entropy
+	start = time.perf_counter()
+	pattern = Pattern(pattern)
+	keyspace, entropy = pattern.keyspace(), pattern.entropy()
+	assert time.perf_counter()-start < 5
+	# Most of the keyspace is in the longest passwords, and so is most of the probability
+	assert entropy < math.log2(keyspace)
+	assert entropy > 100000/2 * math.log2(10)
@@ -0,0 +1,66 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import pickle
+
+import pytest
+
+from src.pattern import Pattern
+from src.rand import FastRandom
+from src.worddict import WordDictionary
+
+LazyIndex = WordDictionary.LazyIndex
+
+WORDS = ['a,i', 'an,at,be', '', 'over,that,this', 'hello,world']
+
+@pytest.fixture
+def words_file(tmp_path):
+	path = tmp_path/'words.txt'
+	path.write_text('\n'.join(WORDS))
+	return str(path)
+
+def test_loads_only_the_lengths_used(words_file):
+	worddict = WordDictionary(words_file, index=LazyIndex(words_file))
+	assert worddict.loadedLengths() == [0]
+	words = {worddict.sample_word(4, rng=FastRandom(i)) for i in range(100)}
+	assert words == {'over', 'that', 'this'}
+	assert worddict.loadedLengths() == [0, 4]
+	assert worddict.index.nbytes() == len(WORDS[3])
+	# Through a pattern, too
+	passwords = Pattern('%W[2]%W[5]', worddict=worddict, rng=FastRandom(3)).generate_many(20, vectorize=False)
+	assert all(len(p) == 7 for p in passwords)
+	assert worddict.loadedLengths() == [0, 2, 4, 5]
+
+def test_matches_compiled_index(words_file):
+	lazy, compiled = LazyIndex(words_file), WordDictionary.compileIndex(words_file)
+	assert len(lazy) == len(compiled) == 11
+	assert lazy.lengths() == compiled.lengths()
+	assert list(lazy.starts) == list(compiled.starts)
+	assert [lazy.word(i) for i in range(len(lazy))] == [compiled.word(i) for i in range(len(compiled))]
+
+def test_pickles_unloaded(words_file):
+	lazy = LazyIndex(words_file)
+	lazy.bucket(4)
+	copy = pickle.loads(pickle.dumps(lazy))
+	assert copy.loaded() == [0]
+	assert copy.bucket(4) == ['over', 'that', 'this']
+
+def test_used_when_the_index_cannot_be_saved(words_file, monkeypatch):
+	access = os.access
+	monkeypatch.setattr(os, 'access', lambda path, mode: False if mode == os.W_OK else access(path, mode))
+	index = WordDictionary.loadIndex(words_file)
+	assert isinstance(index, LazyIndex)
+	assert not os.path.exists(WordDictionary.indexFile(words_file))
@@ -0,0 +1,77 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import string
+
+import pytest
+
+from src.pattern import Pattern
+from src.rand import FastRandom
+
+digits, lower, upper = set(string.digits), set(string.ascii_lowercase), set(string.ascii_uppercase)
+symbols = Pattern.pools_dict['s']
+
+def outputs(pattern, n=2000):
+	return list(Pattern(pattern, rng=FastRandom(10)).generate_many(n, vectorize=False))
+
+def test_signifiers():
+	for pattern, chars in (('%d[6]', digits), ('%w[6]', lower), ('%s[6]', symbols), ('%{dw}[6]', digits | lower), ('%c[6]', digits | lower | symbols)):
+		out = outputs(pattern)
+		assert all(len(p) == 6 for p in out)
+		# Every character of the pool shows up, and nothing else
+		assert set(''.join(out)) == chars
+
+def test_lengths():
+	assert {len(p) for p in outputs('%d[2-5]')} == {2, 3, 4, 5}
+	assert set(outputs('%d[0-1]')) == digits | {''}
+	assert {len(p) for p in outputs('%d%w[3]')} == {4}
+
+def test_uppercase_flag():
+	out = outputs('%w+[5]')
+	assert set(''.join(out)) == upper
+
+def test_capitalize_one_flag():
+	# `^` capitalizes exactly one letter, anywhere
+	out = outputs('%{dw^}[5]')
+	assert all(sum(c in upper for c in p) == (1 if set(p) - digits else 0) for p in out)
+	assert {next(i for i, c in enumerate(p) if c in upper) for p in out if set(p) & upper} == set(range(5))
+
+def test_either_case_flag():
+	out = outputs('%w+^[8]')
+	assert set(''.join(out)) == lower | upper
+	assert any(set(p) & lower and set(p) & upper for p in out)
+
+def test_repeat_flag():
+	out = outputs('%d=[4]')
+	assert all(len(set(p)) == 1 for p in out)
+	assert {p[0] for p in out} == digits
+	# Capitalization applies to the whole run, so it stays one character
+	assert all(len(set(p)) == 1 for p in outputs('%w=^[4]'))
+
+def test_choose_signifier_flag():
+	# `~` draws every character of a password from one signifier
+	out = outputs('%{dw~}[6]')
+	assert all(set(p) <= digits or set(p) <= lower for p in out)
+	assert any(set(p) <= digits for p in out) and any(set(p) <= lower for p in out)
+
+def test_plans():
+	expression = Pattern('%{dw~+}[3]').expressions[0]
+	assert [(plan.words, plan.pool) for plan in expression.plans] == [(False, '0123456789'), (False, string.ascii_uppercase)]
+	assert [plan.words for plan in Pattern('%{dW~}[3]').expressions[0].plans] == [True, False]
+
+@pytest.mark.parametrize('pattern', ['%', '%x', '%dd[', '%{d}[3-1]', '%d++', '%d[0]'])
+def test_invalid_patterns(pattern):
+	with pytest.raises(ValueError):
+		Pattern(pattern)
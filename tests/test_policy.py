@@ -0,0 +1,87 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from collections import Counter
+from itertools import product
+
+import pytest
+
+from src import policy
+from src.policy import Policy
+from src.rand import FastRandom
+
+def valid(password, p):
+	# The rules of `p`, checked directly
+	for (_, chars), minimum in zip(Policy.classes, p.mins):
+		if sum(c in chars for c in password) < minimum:
+			return False
+	return p.max_repeat is None or max(Counter(password).values(), default=0) <= p.max_repeat
+
+def brute_force(p):
+	alphabet = ''.join(p.pools)
+	return sum(valid(''.join(chars), p) for n in p.lengths for chars in product(alphabet, repeat=n))
+
+cases = [
+	('%d[1-3]', {}),
+	('%d[1-3]', {'max_repeat': 1}),
+	('%{dw}[1-3]', {'min_digits': 1, 'min_lower': 1}),
+	('%{dw}[2-3]', {'min_digits': 2, 'max_repeat': 2}),
+	('%{ds}[3]', {'min_digits': 1, 'min_symbols': 1, 'max_repeat': 1}),
+	('%{w+^}[1-2]', {'min_upper': 1, 'min_lower': 1}),
+	('%d[0-3]', {'max_repeat': 2}),
+]
+
+@pytest.mark.parametrize('pattern,rules', cases)
+def test_keyspace_matches_brute_force(pattern, rules):
+	p = Policy(pattern, **rules)
+	assert p.keyspace() == brute_force(p)
+
+@pytest.mark.parametrize('pattern,rules', cases)
+@pytest.mark.parametrize('max_splits', [policy.MAX_SPLITS, 0])
+def test_generated_passwords_meet_the_rules(pattern, rules, max_splits, monkeypatch):
+	# With no split table, lengths and classes are drawn a class at a time
+	monkeypatch.setattr(policy, 'MAX_SPLITS', max_splits)
+	p = Policy(pattern, rng=FastRandom(1), **rules)
+	for password in p.generate_many(500):
+		assert len(password) in p.lengths
+		assert set(password) <= set(''.join(p.pools))
+		assert valid(password, p)
+
+def test_every_password_is_equally_likely():
+	# 90 passwords: two different digits
+	p = Policy('%d[2]', max_repeat=1, rng=FastRandom(2))
+	counts = Counter(p.generate_many(90*400))
+	assert len(counts) == p.keyspace() == 90
+	# Chi-square statistic, well above its 99.99th percentile (about 140 with 89 degrees of freedom) if biased
+	expected = 400
+	assert sum((c-expected)**2/expected for c in counts.values()) < 140
+
+def test_seeded_generation_is_reproducible():
+	p = Policy('%{dsw+^}[8-12]', min_digits=2, min_symbols=1, max_repeat=2)
+	passwords = list(p.generate_range('seed', 0, 20))
+	assert passwords == [p.generate_at('seed', i) for i in range(20)]
+	assert list(p.generate_shard('seed', 20, 1, 2)) == passwords[10:]
+
+@pytest.mark.parametrize('pattern', ['%w^[8]', '%{dw~}[8]', '%{dw~+^}[8]', '%d=[8]', '%W'])
+def test_rejects_flags_it_cannot_honor(pattern):
+	# `^` allows exactly one capital and `~` one signifier, which the policy alphabet would ignore
+	with pytest.raises(ValueError):
+		Policy(pattern, min_digits=1)
+
+def test_impossible_policy():
+	with pytest.raises(ValueError):
+		Policy('%d[4]', min_symbols=1)
+	with pytest.raises(ValueError):
+		Policy('%d[4]', max_repeat=0)
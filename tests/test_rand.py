@@ -0,0 +1,70 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from collections import Counter
+
+import pytest
+
+from src.rand import FastRandom, RandomSource
+
+class Counting(RandomSource):
+	# Every `width`-byte value in turn, little-endian, so a run of draws sees each value exactly once
+	def __init__(self, width=1, block_size=None):
+		RandomSource.__init__(self, block_size)
+		self._stream = b''.join(i.to_bytes(width, 'little') for i in range(256**width))
+		self._offset = 0
+
+	def _entropy(self, n):
+		out = b''
+		while len(out) < n:
+			take = min(n-len(out), len(self._stream)-self._offset)
+			out += self._stream[self._offset:self._offset+take]
+			self._offset = (self._offset+take) % len(self._stream)
+		return out
+
+@pytest.mark.parametrize('n', [1, 2, 7, 10, 26, 54, 200, 256])
+def test_randbelow_small_ranges_are_unbiased(n):
+	# Of one pass over the 256 byte values, the `256 - 256%n` accepted ones map to every index equally
+	rng = Counting()
+	limit = 256 - 256%n
+	counts = Counter(rng.randbelow(n) for _ in range(limit))
+	assert counts == Counter({i: limit//n for i in range(n)})
+	# The rejected bytes are skipped, and the next pass starts over
+	assert rng.randbelow(n) == 0
+
+@pytest.mark.parametrize('n', [257, 1000, 40000])
+def test_randbelow_large_ranges_are_unbiased(n):
+	rng = Counting(2)
+	limit = 65536 - 65536%n
+	counts = Counter(rng.randbelow(n) for _ in range(limit))
+	assert counts == Counter({i: limit//n for i in range(n)})
+
+@pytest.mark.parametrize('pool', ['0123456789', 'abcdefghijklmnopqrstuvwxyz', 'é€x'])
+def test_string_is_unbiased(pool):
+	rng = Counting()
+	limit = 256 - 256%len(pool)
+	counts = Counter(rng.string(pool, limit))
+	assert counts == Counter({c: limit//len(pool) for c in pool})
+
+def test_empty_range():
+	with pytest.raises(ValueError):
+		FastRandom(1).randbelow(0)
+
+def test_entropy_is_buffered():
+	# One byte per draw, less the few rejected, so 1000 draws fit in a single block
+	rng = FastRandom(1, block_size=1024)
+	for _ in range(1000):
+		rng.randbelow(10)
+	assert rng.bytes_drawn == 1024
@@ -0,0 +1,90 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gc
+import weakref
+
+import pytest
+
+from src.registry import DictionaryRegistry
+from src.worddict import WordDictionary
+
+@pytest.fixture
+def defaults_dir(tmp_path):
+	for name, words in (('one', 'a,i'), ('two', 'a\nan,at'), ('three', 'a\nan\nbee,cat,dog')):
+		(tmp_path/(name+'.txt')).write_text(words)
+	return str(tmp_path)
+
+def test_loads_on_first_use(defaults_dir):
+	registry = DictionaryRegistry(defaults_dir)
+	assert registry.names() == ['one', 'three', 'two']
+	worddict = registry.get('two')
+	assert registry.get('two') is worddict
+	assert (registry.hits, registry.misses) == (1, 1)
+	assert worddict.index.bucket(2) == ['an', 'at']
+	with pytest.raises(KeyError):
+		registry.get('four')
+	with pytest.raises(KeyError):
+		registry.get('../one')
+
+def test_evicts_least_recently_used(defaults_dir):
+	registry = DictionaryRegistry(defaults_dir, max_entries=2)
+	one = registry.get('one')
+	registry.get('two')
+	assert registry.get('one') is one
+	registry.get('three')
+	# `two` was the least recently used
+	assert list(registry._entries) == ['one', 'three']
+	registry.resize(max_entries=1)
+	assert list(registry._entries) == ['three']
+
+def test_evicts_over_memory_limit(defaults_dir):
+	registry = DictionaryRegistry(defaults_dir, max_entries=None, max_bytes=1)
+	registry.get('one')
+	registry.get('two')
+	# The most recently used dictionary is kept even alone over the limit
+	assert list(registry._entries) == ['two']
+
+def test_invalidated_when_words_file_changes(defaults_dir):
+	registry = DictionaryRegistry(defaults_dir)
+	one = registry.get('one')
+	registry.get('two')
+	WordDictionary.notifyChange(one.words_file)
+	assert list(registry._entries) == ['two']
+
+def test_registry_is_not_kept_alive():
+	registry = DictionaryRegistry()
+	count = len(WordDictionary.listeners)
+	ref = weakref.ref(registry)
+	del registry
+	gc.collect()
+	assert ref() is None
+	WordDictionary.notifyChange('words.txt')
+	assert len(WordDictionary.listeners) < count
+
+def test_change_listeners_are_not_kept_alive():
+	class Listener:
+		def __init__(self):
+			self.changes = []
+		def changed(self, words_file):
+			self.changes.append(words_file)
+	listener = Listener()
+	WordDictionary.onChange(listener.changed)
+	WordDictionary.notifyChange('words.txt')
+	assert listener.changes == ['words.txt']
+	count = len(WordDictionary.listeners)
+	del listener
+	WordDictionary.notifyChange('words.txt')
+	assert len(WordDictionary.listeners) == count-1
@@ -0,0 +1,55 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from collections import Counter
+
+import pytest
+
+from src.rand import FastRandom
+from src.worddict import WordDictionary
+
+@pytest.fixture
+def worddict(tmp_path):
+	# No words of length 3
+	words_file = tmp_path/'words.txt'
+	words_file.write_text('a,i\nan,at,be\n\nover,that,this')
+	return WordDictionary(str(words_file))
+
+def draws(worddict, *lengths, n=3000):
+	rng = FastRandom(9)
+	return Counter(worddict.sample_word(*lengths, rng=rng) for _ in range(n))
+
+@pytest.mark.parametrize('lengths,pool', [
+	((2,), {'an', 'at', 'be'}),
+	((1, 2), {'a', 'i', 'an', 'at', 'be'}),
+	((2, 4), {'an', 'at', 'be', 'over', 'that', 'this'}),
+	# No words of the length, or beyond the longest: every word
+	((3,), {'a', 'i', 'an', 'at', 'be', 'over', 'that', 'this'}),
+	((9, 12), {'a', 'i', 'an', 'at', 'be', 'over', 'that', 'this'}),
+	((), {'a', 'i', 'an', 'at', 'be', 'over', 'that', 'this'}),
+])
+def test_sample_word_matches_word_pool(worddict, lengths, pool):
+	assert worddict.getWordPool(*lengths) == pool
+	counts = draws(worddict, *lengths)
+	assert set(counts) == pool
+	# Uniform over the pool: every word within five standard deviations of its share
+	expected = 3000/len(pool)
+	assert all(abs(count - expected) <= 5*expected**0.5 for count in counts.values())
+
+def test_empty_dictionary(tmp_path):
+	words_file = tmp_path/'words.txt'
+	words_file.write_text('')
+	worddict = WordDictionary(str(words_file))
+	assert worddict.sample_word(4) == worddict.sample_word() == ''
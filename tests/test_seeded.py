@@ -0,0 +1,66 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from src.pattern import Pattern
+from src.policy import Policy
+
+PATTERN = '%{dws}[4-12]'
+
+def test_range_matches_single_passwords():
+	pattern = Pattern(PATTERN)
+	assert list(pattern.generate_range(7, 10, 20)) == [pattern.generate_at(7, i) for i in range(10, 20)]
+
+def test_reproducible():
+	# A fresh pattern, even from a new process, gives the same stream; `1` and `'1'` are the same seed
+	first = list(Pattern(PATTERN).generate_range(1, 0, 50))
+	assert list(Pattern(PATTERN).generate_range('1', 0, 50)) == first
+	assert list(Pattern(PATTERN).generate_range(2, 0, 50)) != first
+	assert len(set(first)) == 50
+
+def test_position_independent():
+	# Password #N does not depend on the passwords drawn before it
+	pattern = Pattern(PATTERN)
+	full = list(pattern.generate_range('fixture', 0, 100))
+	assert list(pattern.generate_range('fixture', 37, 64)) == full[37:64]
+	assert list(pattern.generate_parallel(30, seed='fixture', start=70)) == full[70:]
+
+@pytest.mark.parametrize('shards', [1, 3, 7])
+def test_shards_concatenate(shards):
+	pattern = Pattern(PATTERN)
+	full = list(pattern.generate_range(5, 0, 50))
+	assert [p for shard in range(shards) for p in pattern.generate_shard(5, 50, shard, shards)] == full
+
+def test_shard_out_of_range():
+	with pytest.raises(ValueError):
+		Pattern(PATTERN).generate_shard(5, 50, 3, 3)
+
+def test_parallel_matches_serial():
+	pattern = Pattern(PATTERN)
+	assert list(pattern.generate_parallel(200, jobs=2, seed=3, start=5)) == list(pattern.generate_range(3, 5, 205))
+
+def test_unique_is_reproducible():
+	pattern = Pattern('%d[3]')
+	first = list(pattern.generate_unique(500, seed=4))
+	assert len(set(first)) == 500
+	assert list(Pattern('%d[3]').generate_unique(500, seed=4)) == first
+
+def test_policy():
+	rules = dict(min_digits=2, min_symbols=1, min_upper=1)
+	policy = Policy('%{dws+^}[10-14]', **rules)
+	passwords = list(policy.generate_range(9, 0, 20))
+	assert passwords == [Policy('%{dws+^}[10-14]', **rules).generate_at(9, i) for i in range(20)]
+	assert all(sum(c.isdigit() for c in p) >= 2 for p in passwords)
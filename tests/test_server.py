@@ -0,0 +1,42 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+
+from src.server import Server
+
+def handle(server, request):
+	return asyncio.run(server.handle(request))
+
+def test_generates_passwords():
+	server = Server(default_pattern='%d[4]')
+	response = handle(server, {'id': 7, 'count': 3, 'unique': True})
+	assert response['id'] == 7
+	assert len(set(response['passwords'])) == 3
+
+def test_rejects_long_passwords_before_generating():
+	server = Server(max_length=100, max_output=1000)
+	assert 'error' in handle(server, {'pattern': '%c[999999999]'})
+	assert 'error' in handle(server, {'pattern': '%c[1-100000]', 'unique': True})
+	assert 'error' in handle(server, {'pattern': '%c[10]', 'count': 101})
+	assert len(handle(server, {'pattern': '%c[10]', 'count': 100})['passwords']) == 100
+
+def test_every_failure_gets_an_answer():
+	server = Server(default_pattern='%d')
+	def fail(*args):
+		raise MemoryError()
+	server.generate = fail
+	assert handle(server, {'id': 1}) == {'id': 1, 'error': 'Internal error: MemoryError'}
+	assert 'error' in handle(Server(), {'id': 2})
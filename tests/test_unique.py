@@ -0,0 +1,63 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from src import unique
+from src.pattern import Pattern
+from src.rand import FastRandom
+
+@pytest.mark.parametrize('capacity', [1, 5, 1000, 3000])
+def test_fingerprint_set_size(capacity):
+	# Two 8-byte slots per entry, whatever the capacity
+	seen = unique.FingerprintSet(capacity)
+	assert len(seen._slots)*seen._slots.itemsize == 16*max(1, capacity)
+	items = [str(i) for i in range(capacity)]
+	assert all(seen.insert(item) for item in items)
+	assert not any(seen.insert(item) for item in items)
+	assert len(seen) == capacity
+	with pytest.raises(OverflowError):
+		seen.insert('full')
+
+@pytest.mark.parametrize('exact_limit', [unique.EXACT_LIMIT, 0])
+def test_generate_is_distinct(exact_limit):
+	pattern = Pattern('%d[3]', rng=FastRandom(4))
+	passwords = list(unique.generate(pattern.generate_many, 900, pattern.keyspace(), exact_limit))
+	assert len(passwords) == len(set(passwords)) == 900
+
+def test_generate_from_iterator_closes_it():
+	pattern = Pattern('%d[3]', rng=FastRandom(5))
+	source = pattern.iter_generate()
+	assert len(set(unique.generate(source, 100, pattern.keyspace()))) == 100
+	with pytest.raises(StopIteration):
+		next(source)
+
+def test_keyspace_too_small():
+	with pytest.raises(ValueError):
+		unique.generate(Pattern('%d').generate_many, 11, 10)
+
+def test_ambiguous_keyspace_fails_before_any_output(monkeypatch):
+	# `%d[1-2]%d[1-2]` counts 12100 passwords, but only 11100 distinct ones exist
+	monkeypatch.setattr(unique, 'MAX_MISSES', 1<<15)
+	pattern = Pattern('%d[1-2]%d[1-2]', rng=FastRandom(6))
+	assert not pattern.keyspace_is_exact()
+	assert pattern.keyspace() == 12100
+	with pytest.raises(ValueError):
+		pattern.generate_unique(11101)
+	assert len(set(pattern.generate_unique(11000))) == 11000
+
+@pytest.mark.parametrize('pattern,exact', [('%d[1-2]%d[2]', True), ('%d[2]%w[1-3]%d[2]', True), ('%d[1-2]%w%c[1-3]', False), ('%c%d', True)])
+def test_keyspace_is_exact(pattern, exact):
+	assert Pattern(pattern).keyspace_is_exact() == exact
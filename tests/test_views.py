@@ -0,0 +1,63 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import pytest
+
+from src.pattern import Pattern
+from src.rand import FastRandom
+from src.worddict import WordDictionary
+
+@pytest.fixture
+def worddict(tmp_path):
+	words_file = tmp_path/'words.txt'
+	words_file.write_text('a,i\nan,at,be\nbee,cat,dog\nover,that,this')
+	return WordDictionary(str(words_file))
+
+def words(worddict):
+	index = worddict.index
+	return [index.word(i) for i in range(index.starts[1], len(index))]
+
+def test_view_filters(worddict):
+	assert words(worddict.view(length_lower=2, length_upper=3, regex='t')) == ['at', 'cat']
+	assert words(worddict.view(charclass='a-e')) == ['a', 'be', 'bee']
+	assert words(worddict.view(blocklist=['THIS', 'a', 'i'], length_upper=2)) == ['an', 'at', 'be']
+	assert words(worddict.view(allowlist=['dog', 'over'])) == ['dog', 'over']
+	# Cached per spec, sharing the parent's storage
+	view = worddict.view(regex='t')
+	assert worddict.view(regex='t') is view
+	assert view.index.parent is worddict.index
+
+def test_view_sampling(worddict):
+	view = worddict.view(regex='^b')
+	pattern = Pattern('%W', view, FastRandom(1))
+	assert set(pattern.generate_many(200)) == {'be', 'bee'}
+	assert pattern.keyspace() == 2
+
+def test_view_persistence(worddict, tmp_path):
+	path = str(tmp_path/'view')
+	view = worddict.view(regex='o', path=path)
+	assert os.path.isfile(path)
+	# A fresh parent loads the saved view instead of filtering again
+	reloaded = WordDictionary(worddict.words_file).view(regex='o', path=path)
+	assert words(reloaded) == words(view) == ['dog', 'over']
+	# Saved views of other filters are not reused
+	assert words(WordDictionary(worddict.words_file).view(regex='^a', path=path)) == ['a', 'an', 'at']
+
+@pytest.mark.parametrize('filters', [{'regex': 'qqqq'}, {'allowlist': []}, {'length_lower': 9}])
+def test_view_without_words(worddict, filters):
+	with pytest.raises(ValueError):
+		worddict.view(**filters)
@@ -0,0 +1,108 @@
+# Copyright 2017 Noah Krim
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from src.pattern import Pattern
+from src.rand import FastRandom
+from src.worddict import WordDictionary
+
+AliasTable = WordDictionary.AliasTable
+
+def write_words(path, lines, counts=None):
+	# Formatted words file, with `counts` in its counts file if given
+	path.write_text('\n'.join(lines))
+	if counts is not None:
+		with open(WordDictionary.countsFile(str(path)), 'w') as f:
+			f.write('\n'.join(counts))
+	return str(path)
+
+def exact_probabilities(table):
+	# Probability of each slot, from the thresholds and aliases instead of sampling
+	one = 1 << AliasTable.bits
+	hits = [0]*len(table)
+	for slot in range(len(table)):
+		hits[slot] += min(table.thresholds[slot], one)
+		hits[table.aliases[slot]] += one - min(table.thresholds[slot], one)
+	return [h/(len(table)*one) for h in hits]
+
+# AliasTable
+
+@pytest.mark.parametrize('weights', [[1], [1, 1, 1, 1], [1, 2, 3, 4], [1000, 1, 0, 5, 0.5], [0, 0, 7]])
+def test_alias_table_probabilities_match_weights(weights):
+	table = AliasTable(weights)
+	total = sum(weights)
+	for p, w in zip(exact_probabilities(table), weights):
+		assert abs(p - w/total) < len(weights) * 2**-AliasTable.bits
+
+def test_alias_table_sampling_frequencies():
+	weights = [5, 1, 3, 0, 1]
+	table = AliasTable(weights, offset=10)
+	randbelow = random.Random(3).randrange
+	n = 100000
+	counts = Counter(table.sample(randbelow) for _ in range(n))
+	assert set(counts) == {10, 11, 12, 14}
+	for i, w in enumerate(weights):
+		expected = n*w/sum(weights)
+		# More than five standard deviations off is a bug, not chance
+		assert abs(counts[10+i] - expected) <= 5*(expected or 1)**0.5
+
+def test_alias_table_rejects_zero_weights():
+	with pytest.raises(ValueError):
+		AliasTable([0, 0])
+	with pytest.raises(ValueError):
+		AliasTable([])
+
+# Weighted dictionaries
+
+def test_weighted_sampling_follows_counts(tmp_path):
+	words_file = write_words(tmp_path/'words.txt', ['a,i', 'an,at'], ['6,2', '1,1'])
+	worddict = WordDictionary(words_file).weighted(1.0)
+	counts = Counter(Pattern('%W', worddict, FastRandom(7)).generate_many(50000))
+	for word, count in (('a', 6), ('i', 2), ('an', 1), ('at', 1)):
+		expected = 50000*count/10
+		assert abs(counts[word] - expected) <= 5*expected**0.5
+	# Exponent 0 is uniform over the words with a count
+	assert Pattern('%W', WordDictionary(words_file).weighted(0.0)).entropy() == pytest.approx(2)
+
+def test_weighted_top(tmp_path):
+	words_file = write_words(tmp_path/'words.txt', ['a,i', 'an,at'], ['6,2', '1,3'])
+	top = WordDictionary(words_file).weighted(0.0, top=2)
+	assert set(Pattern('%W', top, FastRandom(8)).generate_many(1000)) == {'a', 'at'}
+
+def test_weighted_without_counts(tmp_path):
+	words_file = write_words(tmp_path/'words.txt', ['a,i'])
+	with pytest.raises(ValueError):
+		WordDictionary(words_file).weighted()
+	words_file = write_words(tmp_path/'zero.txt', ['a,i'], ['0,0'])
+	with pytest.raises(ValueError):
+		WordDictionary(words_file).weighted()
+
+def test_revert_swaps_counts(tmp_path):
+	words_file = write_words(tmp_path/'words.txt', ['a', 'an,at'], ['5', '2,3'])
+	counts_file = WordDictionary.countsFile(words_file)
+	assert WordDictionary.backup(words_file)
+	os.remove(words_file)
+	os.remove(counts_file)
+	write_words(tmp_path/'words.txt', ['i'])
+	assert WordDictionary.revert(words_file)
+	index = WordDictionary.loadIndex(words_file)
+	assert list(WordDictionary.readCounts(words_file, index)) == [0, 5, 2, 3]
+	# The replaced words file had no counts, so neither does the backup now
+	assert not os.path.exists(WordDictionary.countsFile(words_file+'.old'))